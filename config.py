@@ -1,4 +1,9 @@
 DEFAULT_JSON = "input/input.json"
 DEFAULT_MAP = "input/map.net.xml"
 PROCESSED_DB_PATH = "data/processed_data.json"
-DEFAULT_DATA_CSV ="input/TMC_data.csv"
\ No newline at end of file
+PROCESSED_DB_SQLITE_PATH = "data/processed_data.sqlite"
+DEFAULT_DATA_CSV ="input/TMC_data.csv"
+PLOT_CACHE_DIR = ".cache/analysis"
+PARSED_DATA_CACHE_DIR = ".cache/data"
+OSM_CACHE_DIR = ".cache/osm"
+VALIDATION_CACHE_DIR = ".cache/validation"
\ No newline at end of file
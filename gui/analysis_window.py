@@ -1,71 +1,186 @@
 # gui/analysis_window.py
-import sys, os, logging
+import sys, os, logging, threading, tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
-    QListWidget, QListWidgetItem, QDateTimeEdit, QComboBox, QMessageBox
+    QListWidget, QDateTimeEdit, QComboBox, QMessageBox
 )
-from PyQt5.QtCore import QDateTime, Qt
+from PyQt5.QtCore import QDateTime, Qt, QThread, QObject, QTimer, QUrl, pyqtSignal, pyqtSlot
 
-from simulator import analysis, utils
-from gui.chart_logic import generate_chart, METRIC_MAP, WEATHER_METRICS
+from simulator import utils
+from gui.metrics import METRIC_MAP, WEATHER_METRICS
+from gui import plot_cache
+from config import DEFAULT_JSON, DEFAULT_DATA_CSV
 
-logging.basicConfig(level=logging.DEBUG)
+# Maximum number of per-intersection analysis results kept in memory.
+ANALYSIS_CACHE_SIZE = 64
+# Upper bound on intersections analyzed concurrently.
+ANALYSIS_MAX_WORKERS = 8
+# QWebEngineView.setHtml cannot display content larger than 2 MB.
+SET_HTML_MAX_BYTES = 2_000_000
+# Clicks on the refresh button within this window (ms) are coalesced into one refresh.
+REFRESH_DEBOUNCE_MS = 150
 
 # Define analysis modes and their chart sub-options.
 CHART_OPTIONS = {
-    "single": [
+    "single": (
         "Time Series",
         "Histogram",
         "Box Plot",
         "Peak Traffic by Time of Day",
         "Peak Traffic by Day of Week",
         "Holiday/Weekend Impact"
-    ],
-    "single_metric": [
+    ),
+    "single_metric": (
         "Dual-Axis Time Series",
         "Scatter Plot (Traffic vs. Weather)",
         "Correlation Heatmap",
         "Peak Traffic & Weather Analysis"
-    ],
-    "multi": [
+    ),
+    "multi": (
         "Bar Chart (Average Traffic)",
         "Box Plot Comparison",
         "Line Chart Overlay",
         "Peak Traffic Comparison"
-    ],
-    "multi_metric": [
+    ),
+    "multi_metric": (
         "Bar Chart (Correlation)",
         "Scatter Matrix",
         "Heatmap",
         "Combined Peak Analysis"
-    ]
+    )
 }
 
+STYLESHEET = """
+    QWidget { background-color: #2e2e2e; color: #ffffff; font-family: "Segoe UI", sans-serif; font-size: 10pt; }
+    QLineEdit, QDateTimeEdit, QComboBox { background-color: #3e3e3e; border: 1px solid #5e5e5e; padding: 4px; border-radius: 4px; color: #ffffff; }
+    QPushButton { background-color: #007ACC; border: none; padding: 8px; border-radius: 4px; }
+    QPushButton:hover { background-color: #005999; }
+    QLabel { color: #ffffff; }
+"""
+
 class GraphWindow(QMainWindow):
-    """A window to display the Plotly graph."""
-    def __init__(self, html_content):
+    """A window to display the Plotly graph. Reused across refreshes by swapping its content."""
+    def __init__(self, html_content=None):
         super().__init__()
         self.setWindowTitle("Analysis Graph")
         self.resize(900, 700)
         from PyQt5.QtWebEngineWidgets import QWebEngineView
+        self.webView = None
         try:
             self.webView = QWebEngineView()
-            self.webView.setHtml(html_content)
             self.setCentralWidget(self.webView)
         except Exception as e:
             logging.error(f"Error initializing web view: {e}")
             error_label = QLabel("Error displaying graph: " + str(e))
             self.setCentralWidget(error_label)
+        if html_content is not None:
+            self.setContent(html_content)
+
+    def setContent(self, html_content):
+        if self.webView is not None:
+            self.webView.setHtml(html_content, QUrl("about:blank"))
+
+    def loadFile(self, html_path):
+        if self.webView is not None:
+            self.webView.load(QUrl.fromLocalFile(html_path))
+
+class AnalysisWorker(QObject):
+    """Analyzes the selected intersections and builds the chart HTML off the GUI thread.
+       finished carries (request_id, html, missing_notes, ok); ok is False when the chart failed.
+    """
+    finished = pyqtSignal(int, str, list, bool)
+
+    def __init__(self, request_id, analyze, selected, analysis_mode, chart_type, variant, start_dt, end_dt,
+                 weather_metric, plot_label, parent=None):
+        super().__init__(parent)
+        self.request_id = request_id
+        self.plot_label = plot_label
+        self.analyze = analyze
+        self.selected = selected
+        self.analysis_mode = analysis_mode
+        self.chart_type = chart_type
+        self.variant = variant
+        self.start_dt = start_dt
+        self.end_dt = end_dt
+        self.weather_metric = weather_metric
+
+    def run(self):
+        # Graphs rendered in an earlier session are reused while the data files are unchanged.
+        cached = plot_cache.load_plot(self.analysis_mode, self.plot_label)
+        if cached is not None:
+            html_str, missing_notes = cached
+            self.finished.emit(self.request_id, html_str, missing_notes, True)
+            return
+
+        from gui.chart_logic import generate_chart
+
+        analysis_results = []
+        missing_notes = []
+        failed = False
+        # Intersections are independent; load and analyze them concurrently.
+        with ThreadPoolExecutor(max_workers=min(ANALYSIS_MAX_WORKERS, len(self.selected))) as pool:
+            futures = [pool.submit(self.analyze, inter, self.start_dt, self.end_dt, self.weather_metric)
+                       for inter in self.selected]
+        for inter, future in zip(self.selected, futures):
+            try:
+                result = future.result()
+                analysis_results.append(result)
+                if result["missing_data"]:
+                    missing_notes.append(f"Intersection '{inter}' has missing data for the selected timeframe.")
+            except Exception as e:
+                missing_notes.append(f"Error processing {inter}: {e}")
+                logging.error(f"Error analyzing {inter}: {e}")
+                failed = True
+
+        # A newer refresh superseded this one; skip the chart.
+        if QThread.currentThread().isInterruptionRequested():
+            self.finished.emit(self.request_id, "", missing_notes, False)
+            return
+        try:
+            html_str = generate_chart(analysis_results, self.analysis_mode, self.chart_type, self.variant,
+                                      self.start_dt, self.end_dt, self.weather_metric)
+        except Exception as e:
+            logging.error(f"Error generating Plotly figure: {e}")
+            html_str = "<h1>Error generating graph</h1><p>" + str(e) + "</p>"
+            failed = True
+        # Errors may be transient, so only successful graphs are persisted.
+        if not failed:
+            plot_cache.store_plot(self.analysis_mode, self.plot_label, html_str, missing_notes)
+        self.finished.emit(self.request_id, html_str, missing_notes, not failed)
 
 class AnalysisWindow(QMainWindow):
-    def __init__(self, input_json_file="input/input.json"):
+    def __init__(self, input_json_file=DEFAULT_JSON, data_csv_file=DEFAULT_DATA_CSV):
         super().__init__()
         self.setWindowTitle("Data Analysis")
         self.resize(900, 700)
         self.input_json_file = input_json_file
+        self.data_csv_file = data_csv_file
         self.intersections = []  # Loaded automatically.
+        self.intersections_by_name = {}
+        # Checkable list items, in list order; rebuilt together with the list.
+        self._intersectionItems = []
+        self._analysis_cache = OrderedDict()
+        self._analysis_lock = threading.Lock()
+        # Spec and HTML of the last rendered plot.
+        self._last_plot_label = None
+        self._last_html = None
+        # Graph window, created on first use and reused afterwards.
+        self.graphWindow = None
+        # Temporary files holding graphs too large for setHtml, and the one currently shown.
+        self._temp_files = []
+        self._current_temp_file = None
+        # Id of the latest refresh; results from older ones are dropped.
+        self._analysis_request_id = 0
+        self._current_thread = None
+        self._current_plot_label = None
+        # Running analysis threads and their workers, kept alive until they finish.
+        self._analysis_threads = {}
+        # Mode the chart type options were last built for.
+        self._last_chart_mode = None
         self.initUI()
         self.autoLoadData()
 
@@ -128,9 +243,13 @@ class AnalysisWindow(QMainWindow):
         mainLayout.addWidget(self.intersectionList)
 
         # Analysis refresh button.
-        btnRefresh = QPushButton("Refresh Analysis")
-        btnRefresh.clicked.connect(self.refreshAnalysis)
-        mainLayout.addWidget(btnRefresh)
+        self.btnRefresh = QPushButton("Refresh Analysis")
+        self.btnRefresh.clicked.connect(self.scheduleRefresh)
+        mainLayout.addWidget(self.btnRefresh)
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.setInterval(REFRESH_DEBOUNCE_MS)
+        self.refreshTimer.timeout.connect(self.refreshAnalysis)
 
         # Missing data note label.
         self.noteLabel = QLabel("")
@@ -139,26 +258,35 @@ class AnalysisWindow(QMainWindow):
 
         central.setLayout(mainLayout)
         self.setCentralWidget(central)
-        self.setStyleSheet("""
-            QWidget { background-color: #2e2e2e; color: #ffffff; font-family: "Segoe UI", sans-serif; font-size: 10pt; }
-            QLineEdit, QDateTimeEdit, QComboBox { background-color: #3e3e3e; border: 1px solid #5e5e5e; padding: 4px; border-radius: 4px; color: #ffffff; }
-            QPushButton { background-color: #007ACC; border: none; padding: 8px; border-radius: 4px; }
-            QPushButton:hover { background-color: #005999; }
-            QLabel { color: #ffffff; }
-        """)
+        self.setStyleSheet(STYLESHEET)
         self.updateChartOptions()
 
     def autoLoadData(self):
         try:
             self.intersections = utils.load_input_json(self.input_json_file)
-            self.intersectionList.clear()
-            for inter in self.intersections:
-                if "local_intersection_name" in inter and inter["local_intersection_name"]:
-                    item = QListWidgetItem(inter["local_intersection_name"])
+            # Index the records by name once; a name listed twice is shown (and analyzed) once.
+            self.intersections_by_name = {
+                inter["local_intersection_name"]: inter
+                for inter in self.intersections
+                if inter.get("local_intersection_name")
+            }
+            # Fill the list in one batch without repainting or emitting signals per item.
+            self.intersectionList.setUpdatesEnabled(False)
+            self.intersectionList.blockSignals(True)
+            try:
+                self.intersectionList.clear()
+                self.intersectionList.addItems(list(self.intersections_by_name))
+                self._intersectionItems = [self.intersectionList.item(i) for i in range(self.intersectionList.count())]
+                for item in self._intersectionItems:
                     item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
                     item.setCheckState(Qt.Unchecked)
-                    self.intersectionList.addItem(item)
-            overall_min, overall_max = utils.get_overall_time_range(self.input_json_file)
+            finally:
+                self.intersectionList.blockSignals(False)
+                self.intersectionList.setUpdatesEnabled(True)
+            # Reuse the already-parsed intersections instead of reading the JSON again.
+            overall_min, overall_max = utils.get_overall_time_range(
+                self.input_json_file, self.data_csv_file, intersections=self.intersections
+            )
             self.startTimeEdit.setDateTime(QDateTime(overall_min))
             self.endTimeEdit.setDateTime(QDateTime(overall_max))
         except Exception as e:
@@ -166,25 +294,35 @@ class AnalysisWindow(QMainWindow):
 
     def updateChartOptions(self):
         mode = self.modeCombo.currentData()
+        if mode == self._last_chart_mode:
+            return
+        self._last_chart_mode = mode
+        self.chartTypeCombo.blockSignals(True)
         self.chartTypeCombo.clear()
-        if mode in CHART_OPTIONS:
-            self.chartTypeCombo.addItems(CHART_OPTIONS[mode])
-        else:
-            self.chartTypeCombo.addItem("Default")
-        if mode in ["single_metric", "multi_metric"]:
+        self.chartTypeCombo.addItems(CHART_OPTIONS.get(mode, ("Default",)))
+        self.chartTypeCombo.blockSignals(False)
+        metric_mode = mode in ["single_metric", "multi_metric"]
+        if metric_mode == self.weatherMetricCombo.isEnabled():
+            return
+        if metric_mode:
             self.weatherMetricCombo.setEnabled(True)
+            # Leaving a metric mode clears the selection; start again from the first metric.
+            if self.weatherMetricCombo.currentIndex() == -1:
+                self.weatherMetricCombo.setCurrentIndex(0)
             self.weatherMetricCombo.setToolTip("")
         else:
             self.weatherMetricCombo.setEnabled(False)
             self.weatherMetricCombo.setCurrentIndex(-1)
             self.weatherMetricCombo.setToolTip("Not applicable for this mode")
 
+    def scheduleRefresh(self):
+        # Ignore clicks while an analysis is running; restart the debounce timer otherwise.
+        if self._current_thread is not None:
+            return
+        self.refreshTimer.start()
+
     def refreshAnalysis(self):
-        selected = []
-        for index in range(self.intersectionList.count()):
-            item = self.intersectionList.item(index)
-            if item.checkState() == Qt.Checked:
-                selected.append(item.text())
+        selected = [item.text() for item in self._intersectionItems if item.checkState() == Qt.Checked]
         if not selected:
             QMessageBox.warning(self, "No Selection", "Please select at least one intersection for analysis.")
             return
@@ -202,61 +340,138 @@ class AnalysisWindow(QMainWindow):
         if analysis_mode in ["single_metric", "multi_metric"]:
             weather_metric = METRIC_MAP[self.weatherMetricCombo.currentText()]
         logging.debug(f"Refreshing analysis: mode={analysis_mode}, chart={chart_type}, variant={variant}, weather_metric={weather_metric}, selected={selected}")
-        analysis_results = []
-        missing_notes = []
 
         if analysis_mode in ["single", "single_metric"] and len(selected) != 1:
             QMessageBox.critical(self, "Error", "Please select exactly one intersection for single intersection analysis.")
             return
 
-        for inter in selected:
-            try:
-                if analysis_mode in ["single_metric", "multi_metric"]:
-                    result = analysis.analyze_intersection(inter, start_dt, end_dt, weather_metric=weather_metric)
-                else:
-                    result = analysis.analyze_intersection(inter, start_dt, end_dt)
-                analysis_results.append(result)
-                if result["missing_data"]:
-                    missing_notes.append(f"Intersection '{inter}' has missing data for the selected timeframe.")
-            except Exception as e:
-                missing_notes.append(f"Error processing {inter}: {e}")
-                logging.error(f"Error analyzing {inter}: {e}")
+        # Identical plot spec and unchanged data: show the last graph again.
+        plot_label = (tuple(selected), analysis_mode, chart_type, variant, weather_metric, start_dt, end_dt,
+                      tuple(self.intersectionMtime(inter) for inter in selected))
+        if plot_label == self._last_plot_label:
+            self.openGraphWindow(self._last_html)
+            return
+
+        self.cancelAnalysis()
+        self._analysis_request_id += 1
+        self._current_plot_label = plot_label
+        worker = AnalysisWorker(self._analysis_request_id, self.analyzeIntersection, selected, analysis_mode,
+                                chart_type, variant, start_dt, end_dt, weather_metric, plot_label)
+        thread = QThread()
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.finished.connect(self.onAnalysisFinished)
+        worker.finished.connect(thread.quit)
+        worker.finished.connect(worker.deleteLater)
+        thread.finished.connect(lambda: self._analysis_threads.pop(thread, None))
+        thread.finished.connect(thread.deleteLater)
+        self._analysis_threads[thread] = worker
+        self._current_thread = thread
+        self.btnRefresh.setText("Working…")
+        self.btnRefresh.setEnabled(False)
+        thread.start()
 
+    def cancelAnalysis(self):
+        """Ask the in-flight analysis, if any, to stop before building its chart."""
+        if self._current_thread is not None:
+            self._current_thread.requestInterruption()
+            self._current_thread = None
+
+    @pyqtSlot(int, str, list, bool)
+    def onAnalysisFinished(self, request_id, html_str, missing_notes, ok):
+        # Results of a cancelled or superseded refresh are dropped.
+        if request_id != self._analysis_request_id or self._current_thread is None:
+            return
+        self._current_thread = None
+        self.btnRefresh.setText("Refresh Analysis")
+        self.btnRefresh.setEnabled(True)
         self.noteLabel.setText("Notes:\n" + "\n".join(missing_notes) if missing_notes else "")
-        try:
-            html_str = generate_chart(analysis_results, analysis_mode, chart_type, variant, start_dt, end_dt, weather_metric)
-        except Exception as e:
-            logging.error(f"Error generating Plotly figure: {e}")
-            html_str = "<h1>Error generating graph</h1><p>" + str(e) + "</p>"
         self.openGraphWindow(html_str)
+        # A failed graph is not reused, so the next refresh tries again.
+        if ok:
+            self._last_html = html_str
+            self._last_plot_label = self._current_plot_label
 
-    def openGraphWindow(self, html_content):
-        import tempfile
-        from PyQt5.QtCore import QUrl
-        from PyQt5.QtWebEngineWidgets import QWebEngineView
+    def intersectionMtime(self, inter):
+        """Modification time of an intersection's CSV, or None if it is missing."""
+        from simulator import analysis
 
-        # Write HTML content to a temporary file.
-        temp = tempfile.NamedTemporaryFile(delete=False, suffix=".html")
-        temp.write(html_content.encode("utf-8"))
-        temp.close()
-
-        self.graphWindow = QMainWindow()
-        self.graphWindow.setWindowTitle("Analysis Graph")
-        self.graphWindow.resize(900, 700)
-        webView = QWebEngineView()
-        # Load the temporary file via URL.
-        webView.load(QUrl.fromLocalFile(temp.name))
-        layout = QVBoxLayout()
-        layout.addWidget(webView)
-        central = QWidget()
-        central.setLayout(layout)
-        self.graphWindow.setCentralWidget(central)
+        try:
+            return os.path.getmtime(analysis.intersection_csv_path(inter))
+        except OSError:
+            return None
+
+    def analyzeIntersection(self, inter, start_dt, end_dt, weather_metric):
+        """Return the analysis for one intersection, reusing a cached result
+        when the same timeframe and metric were analyzed before and the
+        intersection's CSV has not changed since."""
+        from simulator import analysis
+
+        key = (inter, start_dt, end_dt, weather_metric, self.intersectionMtime(inter))
+        with self._analysis_lock:
+            result = self._analysis_cache.get(key)
+            if result is not None:
+                self._analysis_cache.move_to_end(key)
+                return result
+        if weather_metric is not None:
+            result = analysis.analyze_intersection(inter, start_dt, end_dt, weather_metric=weather_metric)
+        else:
+            result = analysis.analyze_intersection(inter, start_dt, end_dt)
+        with self._analysis_lock:
+            self._analysis_cache[key] = result
+            if len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+                self._analysis_cache.popitem(last=False)
+        return result
+
+    def openGraphWindow(self, html_content):
+        if self.graphWindow is None:
+            self.graphWindow = GraphWindow()
+            if self.graphWindow.webView is not None:
+                self.graphWindow.webView.loadFinished.connect(self.onGraphLoadFinished)
+        html_bytes = html_content.encode("utf-8")
+        if len(html_bytes) < SET_HTML_MAX_BYTES:
+            self._current_temp_file = None
+            self.graphWindow.setContent(html_content)
+        else:
+            # Too large for setHtml: write HTML content to a temporary file and load it via URL.
+            temp = tempfile.NamedTemporaryFile(delete=False, suffix=".html")
+            temp.write(html_bytes)
+            temp.close()
+            self._temp_files.append(temp.name)
+            self._current_temp_file = temp.name
+            self.graphWindow.loadFile(temp.name)
         self.graphWindow.show()
+        self.graphWindow.raise_()
+        self.graphWindow.activateWindow()
+
+    def onGraphLoadFinished(self, ok):
+        # The previous graph has been replaced, so its temporary file is no longer needed.
+        self.removeTempFiles(keep=self._current_temp_file)
+
+    def removeTempFiles(self, keep=None):
+        remaining = []
+        for path in self._temp_files:
+            if path == keep:
+                remaining.append(path)
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not remove temporary graph file {path}: {e}")
+        self._temp_files = remaining
+
+    def closeEvent(self, event):
+        self.cancelAnalysis()
+        for thread in list(self._analysis_threads):
+            thread.wait()
+        self.removeTempFiles()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     from PyQt5.QtCore import QCoreApplication, Qt
     QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     from PyQt5.QtWidgets import QApplication
+    logging.basicConfig(level=logging.INFO)
     app = QApplication(sys.argv)
     window = AnalysisWindow()
     window.show()
@@ -1,38 +1,157 @@
 # gui/chart_logic.py
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import plotly.graph_objects as go
-import plotly.express as px
+from plotly.offline import get_plotlyjs_version
+import numpy as np
 import pandas as pd
 from simulator import analysis
+from gui.metrics import METRIC_MAP, WEATHER_METRICS
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
-
-# Mapping of friendly weather metric names to actual column names.
-METRIC_MAP = {
-    "Temperature": "temp",
-    "Visibility": "visibility",
-    "Dew Point": "dew_point",
-    "Humidity": "humidity",
-    "Wind Speed": "wind_speed",
-    "Weather": "weather_main_encoded",
-    "Weekend/Holiday": "is_weekend-holiday"
-}
+logger = logging.getLogger(__name__)
+
+# Maximum number of filtered per-intersection frames kept in memory.
+DF_CACHE_SIZE = 32
+# Upper bound on intersections loaded concurrently in the multi-intersection charts.
+LOAD_MAX_WORKERS = 8
+# Maximum number of rendered charts kept in memory.
+CHART_CACHE_SIZE = 32
+# Number of bins used for the pre-binned histograms.
+HISTOGRAM_BINS = 50
+# Traces with more points than this are drawn with WebGL (go.Scattergl); smaller ones stay SVG.
+WEBGL_MIN_POINTS = 5000
 
-# List of friendly weather metric names.
-WEATHER_METRICS = list(METRIC_MAP.keys())
+# Page shell for the charts: plotly.js is loaded from the CDN and only the figure JSON is filled in.
+HTML_TEMPLATE = """<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <style>html, body {height: 100%%; margin: 0;}</style>
+    <script charset="utf-8" src="https://cdn.plot.ly/plotly-%s.min.js"></script>
+</head>
+<body>
+    <div id="chart" style="height:100%%; width:100%%;"></div>
+    <script>
+        var figure = __FIGURE__;
+        Plotly.newPlot("chart", figure.data, figure.layout, {"responsive": true});
+    </script>
+</body>
+</html>""" % get_plotlyjs_version()
+
+# Filtered (df, traffic_cols) keyed by (intersection name, start, end, csv mtime), least recently used first.
+_DF_CACHE = OrderedDict()
+_DF_CACHE_LOCK = threading.Lock()
+# Rendered chart HTML keyed by chart_cache_key(), least recently used first.
+_CHART_CACHE = OrderedDict()
+_CHART_CACHE_LOCK = threading.Lock()
 
 def get_df(inter_name, start_dt, end_dt):
-    """Helper function to load and filter data for a given intersection."""
+    """Helper function to load and filter data for a given intersection.
+       Returns (df, traffic_cols), where traffic_cols lists the columns starting with 'traffic_'.
+       Results are cached until the intersection's CSV changes. A shallow copy is returned so
+       columns added by the chart code never end up in the cached frame.
+    """
     try:
-        df = analysis.load_intersection_data(inter_name)
-        return analysis.get_data_in_timeframe(df, start_dt, end_dt)
+        try:
+            mtime = os.path.getmtime(analysis.intersection_csv_path(inter_name))
+        except OSError:
+            mtime = None
+        key = (inter_name, start_dt, end_dt, mtime)
+        with _DF_CACHE_LOCK:
+            cached = _DF_CACHE.get(key)
+            if cached is not None:
+                _DF_CACHE.move_to_end(key)
+                return cached[0].copy(deep=False), list(cached[1])
+        # The raw frame comes from the analysis loader's bounded, mtime-keyed cache.
+        df = analysis.get_data_in_timeframe(analysis.load_intersection_data(inter_name), start_dt, end_dt)
+        # Hour and day-of-week keys for the peak charts, derived once per cached frame.
+        df["_hour"] = df["datetime_bin"].dt.hour.astype("int8")
+        df["_dow"] = df["datetime_bin"].dt.dayofweek.astype("int8")
+        # Categorical weekend/holiday key so the impact chart groups on codes instead of hashing values.
+        if "is_weekend-holiday" in df.columns:
+            df["_holiday"] = df["is_weekend-holiday"].astype("category")
+        traffic_cols = analysis.traffic_columns(df)
+        with _DF_CACHE_LOCK:
+            _DF_CACHE[key] = (df, traffic_cols)
+            if len(_DF_CACHE) > DF_CACHE_SIZE:
+                _DF_CACHE.popitem(last=False)
+        return df.copy(deep=False), list(traffic_cols)
     except Exception as e:
-        logging.error(f"Error loading data for {inter_name}: {e}")
+        logger.error(f"Error loading data for {inter_name}: {e}")
         raise
 
+def figure_html(fig):
+    """Render a figure into HTML_TEMPLATE. "</" is escaped so data cannot close the script tag."""
+    return HTML_TEMPLATE.replace("__FIGURE__", fig.to_json().replace("</", "<\\/"))
+
+def scatter_type(n_points):
+    """Trace class for n_points: go.Scattergl above WEBGL_MIN_POINTS, go.Scatter otherwise.
+       Charts with a range slider always use go.Scatter, since the slider does not render WebGL traces.
+    """
+    return go.Scattergl if n_points > WEBGL_MIN_POINTS else go.Scatter
+
+def total_traffic(df, traffic_cols):
+    """Row-wise sum of the traffic columns, with NaN counted as 0 like DataFrame.sum(axis=1).
+       Columns are added one at a time into a single output array, so the narrow traffic dtypes are
+       never copied into a float row-major matrix first.
+    """
+    total = np.zeros(len(df))
+    for col in traffic_cols:
+        values = df[col].to_numpy()
+        if values.dtype.kind == "f":
+            np.add(total, values, out=total, where=~np.isnan(values))
+        else:
+            total += values
+    return pd.Series(total, index=df.index, name="Total Traffic")
+
+def load_frames(inter_names, start_dt, end_dt):
+    """get_df for several intersections, loading them concurrently. Returns {name: (df, traffic_cols)}."""
+    with ThreadPoolExecutor(max_workers=max(1, min(LOAD_MAX_WORKERS, len(inter_names)))) as pool:
+        return dict(zip(inter_names, pool.map(lambda name: get_df(name, start_dt, end_dt), inter_names)))
+
+def group_mean(keys, values, n_groups):
+    """Per-key column means for small integer keys in [0, n_groups), e.g. hour of day or day of week.
+       NaN values are skipped like in pandas' groupby mean. Returns (present_keys, means), where means
+       has one row per key that occurs in keys and one column per column of values.
+    """
+    keys = keys.astype(np.intp, copy=False)
+    present = np.flatnonzero(np.bincount(keys, minlength=n_groups))
+    means = np.empty((len(present), values.shape[1]))
+    for j in range(values.shape[1]):
+        column = values[:, j]
+        valid = ~np.isnan(column)
+        sums = np.bincount(keys[valid], weights=column[valid], minlength=n_groups)
+        counts = np.bincount(keys[valid], minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[:, j] = (sums / counts)[present]
+    return present, means
+
+def non_null_values(series):
+    """Values of a series as an ndarray with NaN dropped, without building an intermediate Series."""
+    values = series.to_numpy()
+    if values.dtype.kind == "f":
+        return values[~np.isnan(values)]
+    return values
+
+def histogram_bars(named_series, bins=HISTOGRAM_BINS):
+    """Bin each (name, series) pair on shared edges and return one overlayable go.Bar per series,
+       so only the bin counts are shipped to the browser instead of every value.
+    """
+    arrays = [(name, non_null_values(series)) for name, series in named_series]
+    edges = np.histogram_bin_edges(np.concatenate([values for _, values in arrays]), bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+    return [go.Bar(x=centers, y=np.histogram(values, bins=edges)[0], width=widths, name=name, opacity=0.6)
+            for name, values in arrays]
+
 def generate_chart(analysis_results, mode, chart_type, variant, start_dt, end_dt, weather_metric):
     """
-    Generates and returns an HTML string (via Plotly's to_html) for the chart.
+    Generates and returns an HTML string (rendered into HTML_TEMPLATE) for the chart.
+    Charts are cached by their inputs and the intersections' CSV mtimes. Errors are raised to
+    the caller and never cached, so a retry can succeed.
     
     Parameters:
       - analysis_results: list of analysis dicts.
@@ -44,340 +163,367 @@ def generate_chart(analysis_results, mode, chart_type, variant, start_dt, end_dt
       
     For charts that have a datetime x-axis, a range slider is added.
     """
-    try:
-        if mode in ["single", "single_metric"]:
-            inter_name = analysis_results[0]["local_intersection_name"]
-            df = get_df(inter_name, start_dt, end_dt)
-            if df.empty:
-                fig = go.Figure()
-                fig.add_annotation(text="No data in selected timeframe", x=0.5, y=0.5, showarrow=False)
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-            if variant == "Total Traffic":
-                df["Total Traffic"] = df[traffic_cols].sum(axis=1)
-            if mode == "single":
-                # Non-metric mode.
-                if chart_type == "Time Series":
-                    fig = go.Figure()
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df[col], mode='lines', name=col))
-                    else:
-                        fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df["Total Traffic"], mode='lines', name="Total Traffic"))
-                    fig.update_layout(title=f"Time Series for {inter_name}",
-                                      xaxis_title="Time", yaxis_title="Vehicle Count")
-                elif chart_type == "Histogram":
-                    fig = go.Figure()
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            fig.add_trace(go.Histogram(x=df[col].dropna(), name=col, opacity=0.6))
-                    else:
-                        fig.add_trace(go.Histogram(x=df["Total Traffic"].dropna(), name="Total Traffic", opacity=0.6))
-                    fig.update_layout(title=f"Histogram for {inter_name}",
-                                      xaxis_title="Vehicle Count", barmode='overlay')
-                elif chart_type == "Box Plot":
-                    fig = go.Figure()
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            fig.add_trace(go.Box(y=df[col].dropna(), name=col))
-                    else:
-                        fig.add_trace(go.Box(y=df["Total Traffic"].dropna(), name="Total Traffic"))
-                    fig.update_layout(title=f"Box Plot for {inter_name}", yaxis_title="Vehicle Count")
-                elif chart_type == "Peak Traffic by Time of Day":
-                    df["Hour"] = pd.to_datetime(df["datetime_bin"]).dt.hour
-                    fig = go.Figure()
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            peak = df.groupby("Hour")[col].mean().reset_index()
-                            fig.add_trace(go.Scatter(x=peak["Hour"], y=peak[col], mode='lines+markers', name=col))
-                    else:
-                        peak = df.groupby("Hour")["Total Traffic"].mean().reset_index()
-                        fig.add_trace(go.Scatter(x=peak["Hour"], y=peak["Total Traffic"], mode='lines+markers', name="Total Traffic"))
-                    fig.update_layout(title=f"Peak Traffic by Hour for {inter_name}",
-                                      xaxis_title="Hour", yaxis_title="Average Traffic")
-                elif chart_type == "Peak Traffic by Day of Week":
-                    df["DayOfWeek"] = pd.to_datetime(df["datetime_bin"]).dt.dayofweek
-                    fig = go.Figure()
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            peak = df.groupby("DayOfWeek")[col].mean().reset_index()
-                            fig.add_trace(go.Scatter(x=peak["DayOfWeek"], y=peak[col], mode='lines+markers', name=col))
-                    else:
-                        peak = df.groupby("DayOfWeek")["Total Traffic"].mean().reset_index()
-                        fig.add_trace(go.Scatter(x=peak["DayOfWeek"], y=peak["Total Traffic"], mode='lines+markers', name="Total Traffic"))
-                    fig.update_layout(title=f"Peak Traffic by Day of Week for {inter_name}",
-                                      xaxis_title="Day of Week (0=Monday)", yaxis_title="Average Traffic")
-                elif chart_type == "Holiday/Weekend Impact":
-                    if "is_weekend-holiday" not in df.columns:
-                        fig = go.Figure()
-                        fig.add_annotation(text="Weekend/Holiday indicator missing", x=0.5, y=0.5, showarrow=False)
-                    else:
-                        fig = go.Figure()
-                        if variant == "Lane-specific":
-                            for col in traffic_cols:
-                                avg = df.groupby("is_weekend-holiday")[col].mean().reset_index()
-                                fig.add_trace(go.Scatter(x=avg["is_weekend-holiday"], y=avg[col], mode='lines+markers', name=col))
-                        else:
-                            avg = df.groupby("is_weekend-holiday")["Total Traffic"].mean().reset_index()
-                            fig.add_trace(go.Scatter(x=avg["is_weekend-holiday"], y=avg["Total Traffic"], mode='lines+markers', name="Total Traffic"))
-                        fig.update_layout(title=f"Holiday/Weekend Impact for {inter_name}",
-                                          xaxis_title="Weekend/Holiday Indicator", yaxis_title="Average Traffic")
-                else:
-                    fig = go.Figure()
-                    fig.add_annotation(text="Chart type not recognized", x=0.5, y=0.5, showarrow=False)
-                # For time-series charts, add a date range slider.
-                if chart_type in ["Time Series"]:
-                    fig.update_layout(xaxis=dict(rangeslider=dict(visible=True), type="date"))
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-        
-        elif mode == "single_metric":
-            inter_name = analysis_results[0]["local_intersection_name"]
-            df = get_df(inter_name, start_dt, end_dt)
-            if df.empty:
-                fig = go.Figure()
-                fig.add_annotation(text="No data in selected timeframe", x=0.5, y=0.5, showarrow=False)
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-            if variant == "Total Traffic":
-                df["Total Traffic"] = df[traffic_cols].sum(axis=1)
-            if chart_type == "Dual-Axis Time Series":
-                fig = go.Figure()
-                if variant == "Lane-specific":
-                    for col in traffic_cols:
-                        fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df[col], mode='lines', name=col))
-                else:
-                    fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df["Total Traffic"], mode='lines', name="Total Traffic"))
-                if weather_metric in df.columns:
-                    fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df[weather_metric], mode='lines', name=weather_metric, yaxis="y2"))
-                    fig.update_layout(yaxis2=dict(title=weather_metric, overlaying="y", side="right"))
-                fig.update_layout(title=f"Traffic and {weather_metric} for {inter_name}",
-                                  xaxis_title="Time", yaxis_title="Traffic")
-                if "datetime_bin" in df.columns:
-                    fig.update_layout(xaxis=dict(rangeslider=dict(visible=True), type="date"))
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Scatter Plot (Traffic vs. Weather)":
-                fig = go.Figure()
-                if variant == "Lane-specific":
-                    total_traffic = df[traffic_cols].sum(axis=1)
-                else:
-                    total_traffic = df["Total Traffic"]
-                if weather_metric in df.columns:
-                    fig.add_trace(go.Scatter(x=total_traffic, y=df[weather_metric], mode='markers', name="Traffic vs. Weather"))
-                    fig.update_layout(title=f"Traffic vs. {weather_metric} for {inter_name}",
-                                      xaxis_title="Traffic", yaxis_title=weather_metric)
-                else:
-                    fig.add_annotation(text=f"{weather_metric} data missing", x=0.5, y=0.5, showarrow=False)
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Correlation Heatmap":
-                if weather_metric in df.columns:
-                    cols = traffic_cols + [weather_metric] if variant == "Lane-specific" else ["Total Traffic", weather_metric]
-                    data = df[cols].dropna()
-                    corr = data.corr()
-                    fig = go.Figure(data=go.Heatmap(z=corr.values, x=corr.columns, y=corr.index, colorscale='Viridis'))
-                    fig.update_layout(title=f"Correlation Heatmap for {inter_name}")
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-                else:
-                    fig = go.Figure()
-                    fig.add_annotation(text=f"{weather_metric} data missing", x=0.5, y=0.5, showarrow=False)
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Peak Traffic & Weather Analysis":
-                df["Hour"] = pd.to_datetime(df["datetime_bin"]).dt.hour
-                fig = go.Figure()
-                if variant == "Lane-specific":
-                    for col in traffic_cols:
-                        peak = df.groupby("Hour")[col].mean().reset_index()
-                        fig.add_trace(go.Scatter(x=peak["Hour"], y=peak[col], mode='lines+markers', name=col))
-                else:
-                    peak = df.groupby("Hour")["Total Traffic"].mean().reset_index()
-                    fig.add_trace(go.Scatter(x=peak["Hour"], y=peak["Total Traffic"], mode='lines+markers', name="Total Traffic"))
-                if weather_metric in df.columns:
-                    fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df[weather_metric], mode='lines', name=weather_metric, yaxis="y2"))
-                    fig.update_layout(yaxis2=dict(title=weather_metric, overlaying="y", side="right"))
-                fig.update_layout(title=f"Peak Traffic & {weather_metric} for {inter_name}",
-                                  xaxis_title="Hour", yaxis_title="Average Traffic")
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            else:
-                fig = go.Figure()
-                fig.add_annotation(text="Chart type not recognized", x=0.5, y=0.5, showarrow=False)
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-        elif mode == "multi":
-            if chart_type == "Bar Chart (Average Traffic)":
-                if variant == "Lane-specific":
-                    data = {}
-                    for res in analysis_results:
-                        inter = res["local_intersection_name"]
-                        df = get_df(inter, start_dt, end_dt)
-                        traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                        avgs = df[traffic_cols].mean().to_dict()
-                        data[inter] = avgs
-                    fig = go.Figure()
-                    if data:
-                        lanes = list(next(iter(data.values())).keys())
-                        width = 0.8 / len(data)
-                        x = list(range(len(lanes)))
-                        for i, (inter, avgs) in enumerate(data.items()):
-                            fig.add_trace(go.Bar(x=[xi + i * width for xi in x], y=[avgs[lane] for lane in lanes],
-                                                   name=inter, width=width))
-                        fig.update_layout(title="Lane-specific Average Traffic per Intersection",
-                                          xaxis_title="Lane", yaxis_title="Average Traffic",
-                                          barmode='group',
-                                          xaxis=dict(tickmode='array',
-                                                     tickvals=[xi + width*(len(data)-1)/2 for xi in x],
-                                                     ticktext=lanes))
-                    else:
-                        fig = go.Figure()
-                        fig.add_annotation(text="No data available", x=0.5, y=0.5, showarrow=False)
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-                else:
-                    intersections = []
-                    totals = []
-                    for res in analysis_results:
-                        inter = res["local_intersection_name"]
-                        df = get_df(inter, start_dt, end_dt)
-                        traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                        total_avg = df[traffic_cols].sum(axis=1).mean()
-                        intersections.append(inter)
-                        totals.append(total_avg)
-                    fig = go.Figure(go.Bar(x=intersections, y=totals, marker_color='blue'))
-                    fig.update_layout(title="Average Total Traffic per Intersection",
-                                      xaxis_title="Intersection", yaxis_title="Average Traffic")
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Box Plot Comparison":
-                data = {}
-                for res in analysis_results:
-                    inter = res["local_intersection_name"]
-                    df = get_df(inter, start_dt, end_dt)
-                    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                    if variant == "Lane-specific":
-                        data[inter] = [df[col].dropna() for col in traffic_cols]
-                    else:
-                        df["Total Traffic"] = df[traffic_cols].sum(axis=1)
-                        data[inter] = df["Total Traffic"].dropna()
-                fig = go.Figure()
-                if data:
-                    labels = list(data.keys())
-                    if variant == "Lane-specific":
-                        for inter in labels:
-                            combined = pd.concat(data[inter])
-                            fig.add_trace(go.Box(y=combined, name=inter))
-                        fig.update_layout(title="Combined Lane Traffic Distribution per Intersection", yaxis_title="Traffic")
-                    else:
-                        for inter in labels:
-                            fig.add_trace(go.Box(y=data[inter], name=inter))
-                        fig.update_layout(title="Total Traffic Distribution per Intersection", yaxis_title="Traffic")
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-                else:
-                    fig = go.Figure()
-                    fig.add_annotation(text="No data available for box plot", x=0.5, y=0.5, showarrow=False)
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Line Chart Overlay":
-                fig = go.Figure()
-                for res in analysis_results:
-                    inter = res["local_intersection_name"]
-                    df = get_df(inter, start_dt, end_dt)
-                    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df[col], mode='lines', name=f"{inter}:{col}"))
-                    else:
-                        df["Total Traffic"] = df[traffic_cols].sum(axis=1)
-                        fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df["Total Traffic"], mode='lines', name=inter))
-                fig.update_layout(title="Traffic Time Series Overlay", xaxis_title="Time", yaxis_title="Traffic")
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Peak Traffic Comparison":
-                fig = go.Figure()
-                for res in analysis_results:
-                    inter = res["local_intersection_name"]
-                    df = get_df(inter, start_dt, end_dt)
-                    df["Hour"] = pd.to_datetime(df["datetime_bin"]).dt.hour
-                    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            peak = df.groupby("Hour")[col].mean().reset_index()
-                            fig.add_trace(go.Scatter(x=peak["Hour"], y=peak[col], mode='lines+markers', name=f"{inter}:{col}"))
-                    else:
-                        df["Total Traffic"] = df[traffic_cols].sum(axis=1)
-                        peak = df.groupby("Hour")["Total Traffic"].mean().reset_index()
-                        fig.add_trace(go.Scatter(x=peak["Hour"], y=peak["Total Traffic"], mode='lines+markers', name=inter))
-                fig.update_layout(title="Peak Traffic Comparison by Hour", xaxis_title="Hour", yaxis_title="Average Traffic")
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            else:
-                fig = go.Figure()
-                fig.add_annotation(text="Chart type not recognized", x=0.5, y=0.5, showarrow=False)
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-        elif mode == "multi_metric":
-            if chart_type == "Bar Chart (Correlation)":
-                intersections = [res["local_intersection_name"] for res in analysis_results]
-                correlations = []
-                for res in analysis_results:
-                    corr = res.get("weather_traffic_correlation")
-                    correlations.append(corr if corr is not None else 0)
-                fig = go.Figure(go.Bar(x=intersections, y=correlations, marker_color='green'))
-                fig.update_layout(title="Correlation (Traffic vs. Selected Weather) per Intersection",
-                                  xaxis_title="Intersection", yaxis_title="Correlation Coefficient")
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Scatter Matrix":
-                all_data = []
-                for res in analysis_results:
-                    inter = res["local_intersection_name"]
-                    df = get_df(inter, start_dt, end_dt)
-                    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                    if weather_metric in df.columns and not df.empty:
-                        if variant == "Lane-specific":
-                            total = df[traffic_cols]
-                        else:
-                            total = df[traffic_cols].sum(axis=1)
-                        combined = pd.DataFrame({
-                            "Traffic": total if isinstance(total, pd.Series) else total.sum(axis=1),
-                            "Weather": df[weather_metric]
-                        })
-                        combined["Intersection"] = inter
-                        all_data.append(combined)
-                if all_data:
-                    combined_data = pd.concat(all_data)
-                    fig = px.scatter_matrix(combined_data, dimensions=["Traffic", "Weather"], color="Intersection",
-                                            title="Scatter Matrix (Traffic vs. Selected Weather)")
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-                else:
-                    fig = go.Figure()
-                    fig.add_annotation(text="No combined data for scatter matrix", x=0.5, y=0.5, showarrow=False)
-                    return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Heatmap":
-                intersections = [res["local_intersection_name"] for res in analysis_results]
-                correlations = []
-                for res in analysis_results:
-                    corr = res.get("weather_traffic_correlation")
-                    correlations.append(corr if corr is not None else 0)
-                fig = go.Figure(go.Heatmap(z=[correlations], x=intersections, colorscale='coolwarm'))
-                fig.update_layout(title="Correlation Heatmap (Traffic vs. Selected Weather)")
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            elif chart_type == "Combined Peak Analysis":
-                fig = go.Figure()
-                for res in analysis_results:
-                    inter = res["local_intersection_name"]
-                    df = get_df(inter, start_dt, end_dt)
-                    df["Hour"] = pd.to_datetime(df["datetime_bin"]).dt.hour
-                    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
-                    if variant == "Lane-specific":
-                        for col in traffic_cols:
-                            peak = df.groupby("Hour")[col].mean().reset_index()
-                            fig.add_trace(go.Scatter(x=peak["Hour"], y=peak[col], mode='lines+markers', name=f"{inter}:{col}"))
-                    else:
-                        df["Total Traffic"] = df[traffic_cols].sum(axis=1)
-                        peak = df.groupby("Hour")["Total Traffic"].mean().reset_index()
-                        fig.add_trace(go.Scatter(x=peak["Hour"], y=peak["Total Traffic"], mode='lines+markers', name=inter))
-                fig.update_layout(title="Combined Peak Traffic & Weather Analysis", xaxis_title="Hour", yaxis_title="Average Traffic")
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-            else:
-                fig = go.Figure()
-                fig.add_annotation(text="Chart type not recognized", x=0.5, y=0.5, showarrow=False)
-                return fig.to_html(full_html=True, include_plotlyjs='cdn')
-        else:
-            fig = go.Figure()
-            fig.add_annotation(text="Analysis mode not recognized", x=0.5, y=0.5, showarrow=False)
-            return fig.to_html(full_html=True, include_plotlyjs='cdn')
-    except Exception as e:
-        logging.error(f"Error generating Plotly figure: {e}")
+    key = chart_cache_key(analysis_results, mode, chart_type, variant, start_dt, end_dt, weather_metric)
+    with _CHART_CACHE_LOCK:
+        html = _CHART_CACHE.get(key)
+        if html is not None:
+            _CHART_CACHE.move_to_end(key)
+            return html
+    html = build_chart(analysis_results, mode, chart_type, variant, start_dt, end_dt, weather_metric)
+    if html is not None:
+        with _CHART_CACHE_LOCK:
+            _CHART_CACHE[key] = html
+            if len(_CHART_CACHE) > CHART_CACHE_SIZE:
+                _CHART_CACHE.popitem(last=False)
+    return html
+
+def chart_cache_key(analysis_results, mode, chart_type, variant, start_dt, end_dt, weather_metric):
+    """Key identifying a chart: its inputs plus the mtime of each intersection's CSV, so edited data is re-rendered."""
+    names = tuple(res["local_intersection_name"] for res in analysis_results)
+    mtimes = []
+    for name in names:
+        try:
+            mtimes.append(os.path.getmtime(analysis.intersection_csv_path(name)))
+        except OSError:
+            mtimes.append(None)
+    return (mode, chart_type, variant, start_dt, end_dt, weather_metric, names, tuple(mtimes))
+
+# Inputs shared by the chart handlers. inter_name, df and traffic_cols are only set for the single-intersection modes.
+ChartContext = namedtuple("ChartContext", ["analysis_results", "variant", "start_dt", "end_dt", "weather_metric",
+                                           "inter_name", "df", "traffic_cols"], defaults=(None, None, None))
+
+SINGLE_MODES = ("single", "single_metric")
+MULTI_MODES = ("multi", "multi_metric")
+
+def message_html(text):
+    """HTML for an empty figure carrying a single centered message."""
+    fig = go.Figure()
+    fig.add_annotation(text=text, x=0.5, y=0.5, showarrow=False)
+    return figure_html(fig)
+
+def build_chart(analysis_results, mode, chart_type, variant, start_dt, end_dt, weather_metric):
+    """Build the chart HTML for generate_chart, without caching or error handling.
+       The handler is looked up in CHART_HANDLERS by (mode, chart_type).
+    """
+    if mode not in SINGLE_MODES and mode not in MULTI_MODES:
+        return message_html("Analysis mode not recognized")
+    ctx = ChartContext(analysis_results, variant, start_dt, end_dt, weather_metric)
+    if mode in SINGLE_MODES:
+        inter_name = analysis_results[0]["local_intersection_name"]
+        df, traffic_cols = get_df(inter_name, start_dt, end_dt)
+        if df.empty:
+            return message_html("No data in selected timeframe")
+        if variant == "Total Traffic":
+            df["Total Traffic"] = total_traffic(df, traffic_cols)
+        ctx = ctx._replace(inter_name=inter_name, df=df, traffic_cols=traffic_cols)
+    handler = CHART_HANDLERS.get((mode, chart_type))
+    if handler is None:
+        return message_html("Chart type not recognized")
+    return handler(ctx)
+
+def _frames(ctx):
+    return load_frames([res["local_intersection_name"] for res in ctx.analysis_results], ctx.start_dt, ctx.end_dt)
+
+# --- single ---
+
+def _time_series(ctx):
+    df, traffic_cols = ctx.df, ctx.traffic_cols
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        fig.add_traces([go.Scatter(x=df["datetime_bin"], y=df[col], mode='lines', name=col) for col in traffic_cols])
+    else:
+        fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df["Total Traffic"], mode='lines', name="Total Traffic"))
+    fig.update_layout(title=f"Time Series for {ctx.inter_name}",
+                      xaxis_title="Time", yaxis_title="Vehicle Count")
+    fig.update_layout(xaxis=dict(rangeslider=dict(visible=True), type="date"))
+    return figure_html(fig)
+
+def _histogram(ctx):
+    df, traffic_cols = ctx.df, ctx.traffic_cols
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        fig.add_traces(histogram_bars([(col, df[col]) for col in traffic_cols]))
+    else:
+        fig.add_traces(histogram_bars([("Total Traffic", df["Total Traffic"])]))
+    fig.update_layout(title=f"Histogram for {ctx.inter_name}",
+                      xaxis_title="Vehicle Count", barmode='overlay')
+    return figure_html(fig)
+
+def _box_plot(ctx):
+    df, traffic_cols = ctx.df, ctx.traffic_cols
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        fig.add_traces([go.Box(y=non_null_values(df[col]), name=col) for col in traffic_cols])
+    else:
+        fig.add_trace(go.Box(y=non_null_values(df["Total Traffic"]), name="Total Traffic"))
+    fig.update_layout(title=f"Box Plot for {ctx.inter_name}", yaxis_title="Vehicle Count")
+    return figure_html(fig)
+
+def _peak_by_hour(ctx):
+    df, traffic_cols = ctx.df, ctx.traffic_cols
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        hours, peak = group_mean(df["_hour"].to_numpy(), df[traffic_cols].to_numpy(dtype=float), 24)
+        fig.add_traces([go.Scatter(x=hours, y=peak[:, i], mode='lines+markers', name=col) for i, col in enumerate(traffic_cols)])
+    else:
+        hours, peak = group_mean(df["_hour"].to_numpy(), df[["Total Traffic"]].to_numpy(dtype=float), 24)
+        fig.add_trace(go.Scatter(x=hours, y=peak[:, 0], mode='lines+markers', name="Total Traffic"))
+    fig.update_layout(title=f"Peak Traffic by Hour for {ctx.inter_name}",
+                      xaxis_title="Hour", yaxis_title="Average Traffic")
+    return figure_html(fig)
+
+def _peak_by_day(ctx):
+    df, traffic_cols = ctx.df, ctx.traffic_cols
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        days, peak = group_mean(df["_dow"].to_numpy(), df[traffic_cols].to_numpy(dtype=float), 7)
+        fig.add_traces([go.Scatter(x=days, y=peak[:, i], mode='lines+markers', name=col) for i, col in enumerate(traffic_cols)])
+    else:
+        days, peak = group_mean(df["_dow"].to_numpy(), df[["Total Traffic"]].to_numpy(dtype=float), 7)
+        fig.add_trace(go.Scatter(x=days, y=peak[:, 0], mode='lines+markers', name="Total Traffic"))
+    fig.update_layout(title=f"Peak Traffic by Day of Week for {ctx.inter_name}",
+                      xaxis_title="Day of Week (0=Monday)", yaxis_title="Average Traffic")
+    return figure_html(fig)
+
+def _holiday_impact(ctx):
+    df, traffic_cols = ctx.df, ctx.traffic_cols
+    if "is_weekend-holiday" not in df.columns:
+        return message_html("Weekend/Holiday indicator missing")
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        avg = df.groupby("_holiday", observed=True)[traffic_cols].mean()
+        fig.add_traces([go.Scatter(x=avg.index, y=avg[col], mode='lines+markers', name=col) for col in traffic_cols])
+    else:
+        avg = df.groupby("_holiday", observed=True)["Total Traffic"].mean()
+        fig.add_trace(go.Scatter(x=avg.index, y=avg.values, mode='lines+markers', name="Total Traffic"))
+    fig.update_layout(title=f"Holiday/Weekend Impact for {ctx.inter_name}",
+                      xaxis_title="Weekend/Holiday Indicator", yaxis_title="Average Traffic")
+    return figure_html(fig)
+
+# --- single_metric ---
+
+def _dual_axis_time_series(ctx):
+    df, traffic_cols, weather_metric = ctx.df, ctx.traffic_cols, ctx.weather_metric
+    fig = go.Figure()
+    if ctx.variant == "Lane-specific":
+        fig.add_traces([go.Scatter(x=df["datetime_bin"], y=df[col], mode='lines', name=col) for col in traffic_cols])
+    else:
+        fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df["Total Traffic"], mode='lines', name="Total Traffic"))
+    if weather_metric in df.columns:
+        fig.add_trace(go.Scatter(x=df["datetime_bin"], y=df[weather_metric], mode='lines', name=weather_metric, yaxis="y2"))
+        fig.update_layout(yaxis2=dict(title=weather_metric, overlaying="y", side="right"))
+    fig.update_layout(title=f"Traffic and {weather_metric} for {ctx.inter_name}",
+                      xaxis_title="Time", yaxis_title="Traffic")
+    if "datetime_bin" in df.columns:
+        fig.update_layout(xaxis=dict(rangeslider=dict(visible=True), type="date"))
+    return figure_html(fig)
+
+def _traffic_weather_scatter(ctx):
+    df, weather_metric = ctx.df, ctx.weather_metric
+    if weather_metric not in df.columns:
+        return message_html(f"{weather_metric} data missing")
+    traffic = total_traffic(df, ctx.traffic_cols) if ctx.variant == "Lane-specific" else df["Total Traffic"]
+    fig = go.Figure()
+    fig.add_trace(scatter_type(len(df))(x=traffic, y=df[weather_metric], mode='markers', name="Traffic vs. Weather"))
+    fig.update_layout(title=f"Traffic vs. {weather_metric} for {ctx.inter_name}",
+                      xaxis_title="Traffic", yaxis_title=weather_metric)
+    return figure_html(fig)
+
+def _correlation_heatmap(ctx):
+    df, weather_metric = ctx.df, ctx.weather_metric
+    if weather_metric not in df.columns:
+        return message_html(f"{weather_metric} data missing")
+    cols = ctx.traffic_cols + [weather_metric] if ctx.variant == "Lane-specific" else ["Total Traffic", weather_metric]
+    # Pairwise-complete correlation; no NaN-free copy of the columns is built.
+    corr = df[cols].corr()
+    fig = go.Figure(data=go.Heatmap(z=corr.values, x=corr.columns, y=corr.index, colorscale='Viridis'))
+    fig.update_layout(title=f"Correlation Heatmap for {ctx.inter_name}")
+    return figure_html(fig)
+
+def _peak_and_weather(ctx):
+    df, weather_metric = ctx.df, ctx.weather_metric
+    fig = go.Figure()
+    cols = ctx.traffic_cols if ctx.variant == "Lane-specific" else ["Total Traffic"]
+    has_weather = weather_metric in df.columns
+    # Traffic and weather are averaged per hour in the same pass; the weather mean is the last column.
+    hours, peak = group_mean(df["_hour"].to_numpy(),
+                             df[cols + [weather_metric] if has_weather else cols].to_numpy(dtype=float), 24)
+    fig.add_traces([go.Scatter(x=hours, y=peak[:, i], mode='lines+markers', name=col) for i, col in enumerate(cols)])
+    if has_weather:
+        fig.add_trace(go.Scatter(x=hours, y=peak[:, -1], mode='lines+markers', name=weather_metric, yaxis="y2"))
+        fig.update_layout(yaxis2=dict(title=weather_metric, overlaying="y", side="right"))
+    fig.update_layout(title=f"Peak Traffic & {weather_metric} for {ctx.inter_name}",
+                      xaxis_title="Hour", yaxis_title="Average Traffic")
+    return figure_html(fig)
+
+# --- multi ---
+
+def _average_bar(ctx):
+    frames = _frames(ctx)
+    if ctx.variant == "Lane-specific":
+        data = {}
+        for res in ctx.analysis_results:
+            inter = res["local_intersection_name"]
+            df, traffic_cols = frames[inter]
+            data[inter] = df[traffic_cols].mean().to_dict()
+        if not data:
+            return message_html("No data available")
         fig = go.Figure()
-        fig.add_annotation(text=f"Error generating figure: {e}", x=0.5, y=0.5, showarrow=False)
-        return fig.to_html(full_html=True, include_plotlyjs='cdn')
+        lanes = list(next(iter(data.values())).keys())
+        width = 0.8 / len(data)
+        x = list(range(len(lanes)))
+        fig.add_traces([go.Bar(x=[xi + i * width for xi in x], y=[avgs[lane] for lane in lanes],
+                               name=inter, width=width)
+                        for i, (inter, avgs) in enumerate(data.items())])
+        fig.update_layout(title="Lane-specific Average Traffic per Intersection",
+                          xaxis_title="Lane", yaxis_title="Average Traffic",
+                          barmode='group',
+                          xaxis=dict(tickmode='array',
+                                     tickvals=[xi + width*(len(data)-1)/2 for xi in x],
+                                     ticktext=lanes))
+        return figure_html(fig)
+    intersections = []
+    totals = []
+    for res in ctx.analysis_results:
+        inter = res["local_intersection_name"]
+        df, traffic_cols = frames[inter]
+        intersections.append(inter)
+        totals.append(total_traffic(df, traffic_cols).mean())
+    fig = go.Figure(go.Bar(x=intersections, y=totals, marker_color='blue'))
+    fig.update_layout(title="Average Total Traffic per Intersection",
+                      xaxis_title="Intersection", yaxis_title="Average Traffic")
+    return figure_html(fig)
+
+def _box_comparison(ctx):
+    frames = _frames(ctx)
+    data = {}
+    for res in ctx.analysis_results:
+        inter = res["local_intersection_name"]
+        df, traffic_cols = frames[inter]
+        if ctx.variant == "Lane-specific":
+            # All lanes pooled into one flat array; no per-lane Series or pd.concat.
+            data[inter] = np.concatenate([non_null_values(df[col]) for col in traffic_cols])
+        else:
+            # total_traffic counts NaN as 0, so the total never holds NaN.
+            data[inter] = total_traffic(df, traffic_cols).to_numpy()
+    if not data:
+        return message_html("No data available for box plot")
+    fig = go.Figure()
+    fig.add_traces([go.Box(y=values, name=inter) for inter, values in data.items()])
+    if ctx.variant == "Lane-specific":
+        fig.update_layout(title="Combined Lane Traffic Distribution per Intersection", yaxis_title="Traffic")
+    else:
+        fig.update_layout(title="Total Traffic Distribution per Intersection", yaxis_title="Traffic")
+    return figure_html(fig)
+
+def _line_overlay(ctx):
+    frames = _frames(ctx)
+    fig = go.Figure()
+    for res in ctx.analysis_results:
+        inter = res["local_intersection_name"]
+        df, traffic_cols = frames[inter]
+        trace = scatter_type(len(df))
+        if ctx.variant == "Lane-specific":
+            fig.add_traces([trace(x=df["datetime_bin"], y=df[col], mode='lines', name=f"{inter}:{col}") for col in traffic_cols])
+        else:
+            df["Total Traffic"] = total_traffic(df, traffic_cols)
+            fig.add_trace(trace(x=df["datetime_bin"], y=df["Total Traffic"], mode='lines', name=inter))
+    fig.update_layout(title="Traffic Time Series Overlay", xaxis_title="Time", yaxis_title="Traffic")
+    return figure_html(fig)
+
+def _peak_per_intersection(ctx, title):
+    """Hourly mean traffic per intersection (per lane or total), as used by the multi and multi_metric peak charts."""
+    frames = _frames(ctx)
+    fig = go.Figure()
+    for res in ctx.analysis_results:
+        inter = res["local_intersection_name"]
+        df, traffic_cols = frames[inter]
+        if ctx.variant == "Lane-specific":
+            hours, peak = group_mean(df["_hour"].to_numpy(), df[traffic_cols].to_numpy(dtype=float), 24)
+            fig.add_traces([go.Scatter(x=hours, y=peak[:, i], mode='lines+markers', name=f"{inter}:{col}") for i, col in enumerate(traffic_cols)])
+        else:
+            df["Total Traffic"] = total_traffic(df, traffic_cols)
+            hours, peak = group_mean(df["_hour"].to_numpy(), df[["Total Traffic"]].to_numpy(dtype=float), 24)
+            fig.add_trace(go.Scatter(x=hours, y=peak[:, 0], mode='lines+markers', name=inter))
+    fig.update_layout(title=title, xaxis_title="Hour", yaxis_title="Average Traffic")
+    return figure_html(fig)
+
+def _peak_comparison(ctx):
+    return _peak_per_intersection(ctx, "Peak Traffic Comparison by Hour")
+
+# --- multi_metric ---
+
+def _correlations(ctx):
+    """Intersection names and their traffic/weather correlation from the analysis results, with None as 0.
+       Not memoized separately: the values depend on the timeframe and CSV contents, which the chart
+       cache key already covers.
+    """
+    intersections = []
+    correlations = []
+    for res in ctx.analysis_results:
+        corr = res.get("weather_traffic_correlation")
+        intersections.append(res["local_intersection_name"])
+        correlations.append(corr if corr is not None else 0)
+    return intersections, correlations
+
+def _correlation_bar(ctx):
+    intersections, correlations = _correlations(ctx)
+    fig = go.Figure(go.Bar(x=intersections, y=correlations, marker_color='green'))
+    fig.update_layout(title="Correlation (Traffic vs. Selected Weather) per Intersection",
+                      xaxis_title="Intersection", yaxis_title="Correlation Coefficient")
+    return figure_html(fig)
+
+def _scatter_matrix(ctx):
+    frames = _frames(ctx)
+    weather_metric = ctx.weather_metric
+    all_data = []
+    for res in ctx.analysis_results:
+        inter = res["local_intersection_name"]
+        df, traffic_cols = frames[inter]
+        if weather_metric in df.columns and not df.empty:
+            # Both variants plot the total; the scatter matrix has a single traffic dimension.
+            combined = pd.DataFrame({
+                "Traffic": total_traffic(df, traffic_cols),
+                "Weather": df[weather_metric]
+            })
+            combined["Intersection"] = inter
+            all_data.append(combined)
+    if not all_data:
+        return message_html("No combined data for scatter matrix")
+    combined_data = pd.concat(all_data)
+    # plotly.express is slow to import and only this chart uses it.
+    import plotly.express as px
+    fig = px.scatter_matrix(combined_data, dimensions=["Traffic", "Weather"], color="Intersection",
+                            title="Scatter Matrix (Traffic vs. Selected Weather)")
+    return figure_html(fig)
+
+def _correlation_heatmap_multi(ctx):
+    intersections, correlations = _correlations(ctx)
+    fig = go.Figure(go.Heatmap(z=[correlations], x=intersections, colorscale='coolwarm'))
+    fig.update_layout(title="Correlation Heatmap (Traffic vs. Selected Weather)")
+    return figure_html(fig)
+
+def _combined_peak(ctx):
+    return _peak_per_intersection(ctx, "Combined Peak Traffic & Weather Analysis")
+
+# (mode, chart type) -> handler taking a ChartContext and returning the chart HTML.
+CHART_HANDLERS = {
+    ("single", "Time Series"): _time_series,
+    ("single", "Histogram"): _histogram,
+    ("single", "Box Plot"): _box_plot,
+    ("single", "Peak Traffic by Time of Day"): _peak_by_hour,
+    ("single", "Peak Traffic by Day of Week"): _peak_by_day,
+    ("single", "Holiday/Weekend Impact"): _holiday_impact,
+    ("single_metric", "Dual-Axis Time Series"): _dual_axis_time_series,
+    ("single_metric", "Scatter Plot (Traffic vs. Weather)"): _traffic_weather_scatter,
+    ("single_metric", "Correlation Heatmap"): _correlation_heatmap,
+    ("single_metric", "Peak Traffic & Weather Analysis"): _peak_and_weather,
+    ("multi", "Bar Chart (Average Traffic)"): _average_bar,
+    ("multi", "Box Plot Comparison"): _box_comparison,
+    ("multi", "Line Chart Overlay"): _line_overlay,
+    ("multi", "Peak Traffic Comparison"): _peak_comparison,
+    ("multi_metric", "Bar Chart (Correlation)"): _correlation_bar,
+    ("multi_metric", "Scatter Matrix"): _scatter_matrix,
+    ("multi_metric", "Heatmap"): _correlation_heatmap_multi,
+    ("multi_metric", "Combined Peak Analysis"): _combined_peak,
+}
@@ -1,17 +1,25 @@
-import sys, os, subprocess, csv
+import sys, os, subprocess
 from datetime import datetime, timedelta
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QFormLayout, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox,
-    QDateTimeEdit, QComboBox, QSlider, QCheckBox, QTableWidget, QTableWidgetItem,
+    QDateTimeEdit, QComboBox, QSlider, QCheckBox, QTableView,
     QHeaderView, QDialog, QGroupBox
 )
-from PyQt5.QtCore import QDateTime, Qt, QThread, QObject, pyqtSignal
+from PyQt5.QtCore import QDateTime, Qt, QObject, QRunnable, QThreadPool, QAbstractTableModel, QModelIndex, pyqtSignal
 from simulator import simulation, utils
 from simulator import edge_mapping
 from simulator.auto_fetch import fetch_map_for_intersections, fetch_csv_data
 from config import DEFAULT_JSON, DEFAULT_MAP, DEFAULT_DATA_CSV
 
+# Row height (px) of the data availability table.
+DETAIL_ROW_HEIGHT = 22
+
+def file_version(path):
+    """(absolute path, mtime, size) of a file, used to tell whether cached parse results are stale."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime, stat.st_size)
+
 # ------------------ ConfigureParametersDialog ------------------
 class ConfigureParametersDialog(QDialog):
     def __init__(self, current_params, parent=None):
@@ -81,31 +89,92 @@ class LoadingDialog(QDialog):
         self.label.setWordWrap(True)
         layout.addWidget(self.label, alignment=Qt.AlignCenter)
 
-class AutoFetchWorker(QObject):
+class WorkerSignals(QObject):
+    """Signals of the auto-fetch runnables; QRunnable is not a QObject and cannot declare its own."""
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
-    
-    def __init__(self, coordinates, parent=None):
-        super().__init__(parent)
+
+class AutoFetchWorker(QRunnable):
+    def __init__(self, coordinates):
+        super().__init__()
         self.coordinates = coordinates
+        self.signals = WorkerSignals()
     
     def run(self):
         try:
             net_file = fetch_map_for_intersections(self.coordinates, data_folder="data", radius_km=5)
-            self.finished.emit(net_file)
+            self.signals.finished.emit(net_file)
         except Exception as e:
-            self.error.emit(str(e))
+            self.signals.error.emit(str(e))
 
-class AutoFetchDataWorker(QObject):
-    finished = pyqtSignal(str)
-    error = pyqtSignal(str)
+class AutoFetchDataWorker(QRunnable):
+    def __init__(self):
+        super().__init__()
+        self.signals = WorkerSignals()
     
     def run(self):
         try:
             csv_file = fetch_csv_data(data_folder="data")
-            self.finished.emit(csv_file)
+            self.signals.finished.emit(csv_file)
         except Exception as e:
-            self.error.emit(str(e))
+            self.signals.error.emit(str(e))
+
+class TimeRangeSignals(QObject):
+    finished = pyqtSignal(object, object, object, object)
+    error = pyqtSignal(str)
+
+class TimeRangeWorker(QRunnable):
+    """Scans the CSV for the overall time range and the per-intersection availability.
+       finished carries the file version passed in, so the result can be cached against it.
+    """
+    def __init__(self, json_file, csv_file, version):
+        super().__init__()
+        self.json_file = json_file
+        self.csv_file = csv_file
+        self.version = version
+        self.signals = TimeRangeSignals()
+
+    def run(self):
+        try:
+            overall_min, overall_max = utils.get_overall_time_range(self.json_file, self.csv_file)
+            detailed = utils.get_data_availability_by_intersection(self.json_file, self.csv_file)
+            self.signals.finished.emit(self.version, overall_min, overall_max, detailed)
+        except Exception as e:
+            self.signals.error.emit(str(e))
+
+# ------------------ AvailabilityModel ------------------
+class AvailabilityModel(QAbstractTableModel):
+    """Read-only model for the data availability table. Rows are (centreline_id, start, end) tuples;
+       the view only asks for the cells it is currently showing.
+    """
+    HEADERS = ("Centreline ID", "Start Time", "End Time")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+
+    def setRows(self, rows):
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self._rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return section + 1
 
 # ------------------ MainWindow ------------------
 class MainWindow(QMainWindow):
@@ -117,6 +186,8 @@ class MainWindow(QMainWindow):
         self.overall_max = None  
         self.sim_duration = timedelta(minutes=15)
         self._simulation_running = False
+        # Results parsed from the input CSV, keyed by purpose -> (file version, value).
+        self._csv_cache = {}
         self.vehicle_params = {
             "car":   {"carFollowModel": "Krauss", "accel": "1.0", "decel": "4.5", "sigma": "0.5", "length": "5",  "maxSpeed": "25"},
             "truck": {"carFollowModel": "Krauss", "accel": "0.8", "decel": "4.0", "sigma": "0.5", "length": "12", "maxSpeed": "20"},
@@ -201,16 +272,20 @@ class MainWindow(QMainWindow):
         formLayout.addRow(QLabel("Simulation Window:"), hboxDuration)
 
         # Button to load overall time range and update detailed table
-        btnLoadRange = QPushButton("Load Time Range")
-        btnLoadRange.clicked.connect(self.loadTimeRange)
-        formLayout.addRow(btnLoadRange)
+        self.btnLoadRange = QPushButton("Load Time Range")
+        self.btnLoadRange.clicked.connect(self.loadTimeRange)
+        formLayout.addRow(self.btnLoadRange)
 
         mainLayout.addLayout(formLayout)
         
         # Detailed Time Range Table
-        self.detailTable = QTableWidget()
-        self.detailTable.setColumnCount(3)
-        self.detailTable.setHorizontalHeaderLabels(["Centreline ID", "Start Time", "End Time"])
+        self.detailModel = AvailabilityModel(self)
+        self.detailTable = QTableView()
+        self.detailTable.setModel(self.detailModel)
+        # Fixed row heights and no wrapping, so the view never measures every row's contents.
+        self.detailTable.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.detailTable.verticalHeader().setDefaultSectionSize(DETAIL_ROW_HEIGHT)
+        self.detailTable.setWordWrap(False)
         self.detailTable.horizontalHeader().setStyleSheet("""
             QHeaderView::section {
                 background-color: #3e3e3e;
@@ -237,7 +312,7 @@ class MainWindow(QMainWindow):
         central.setLayout(mainLayout)
         self.setStyleSheet("""
             QWidget { background-color: #2e2e2e; color: #ffffff; font-family: "Segoe UI", sans-serif; font-size: 10pt; }
-            QLineEdit, QDateTimeEdit, QComboBox, QTableWidget {
+            QLineEdit, QDateTimeEdit, QComboBox, QTableView {
                 background-color: #3e3e3e; border: 1px solid #5e5e5e;
                 padding: 4px; border-radius: 4px; color: #ffffff;
             }
@@ -295,11 +370,9 @@ class MainWindow(QMainWindow):
             self.show_error("Error", "Please select a valid CSV file first.")
             return
 
-        # 1) Load centreline_ids from the JSON:
+        # 1) Load centreline_ids from the JSON (parsed with orjson when available, cached until it changes):
         try:
-            with open(json_file, "r", encoding="utf-8") as jf:
-                import json
-                intersections = json.load(jf)
+            intersections = utils.load_input_json(json_file)
         except Exception as e:
             self.show_error("Error", f"Failed to read JSON: {e}")
             return
@@ -316,57 +389,52 @@ class MainWindow(QMainWindow):
             self.show_error("Error", "No centreline_id found in the JSON.")
             return
 
-        # 2) Read the CSV and collect coords only for those IDs in json_ids
-        coords = {}
+        # 2) Look up the coords of the IDs in json_ids (the CSV is only re-read when it changes)
         try:
-            with open(csv_file, newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    raw_cid = row.get("centreline_id")
-                    if raw_cid is None:
-                        continue
-                    cid_str = str(raw_cid).strip()
-                    # Only keep rows whose centreline_id is in the JSON set
-                    if cid_str not in json_ids:
-                        continue
-
-                    try:
-                        lat = float(row["latitude"])
-                        lon = float(row["longitude"])
-                    except Exception:
-                        continue
-
-                    # We only need one (lat, lon) per centreline_id
-                    if cid_str not in coords:
-                        coords[cid_str] = (lat, lon)
+            all_coords = self._csvCoordinates(csv_file)
         except Exception as e:
             self.show_error("Error", f"Failed to read CSV: {e}")
             return
 
-        if not coords:
+        # Build a list of (lat, lon) tuples for the auto‐fetch worker
+        coord_list = [coords for cid, coords in all_coords.items() if cid in json_ids]
+        if not coord_list:
             self.show_error("Error", "No matching coordinates found in CSV for JSON intersections.")
             return
 
-        # Build a list of (lat, lon) tuples for the auto‐fetch worker
-        coord_list = list(coords.values())
-
-        # 3) Spawn the LoadingDialog + worker thread as before
+        # 3) Show the LoadingDialog and run the worker on the shared thread pool
         loading = LoadingDialog(self)
         loading.show()
         QApplication.processEvents()
 
-        self.thread = QThread()
         self.worker = AutoFetchWorker(coord_list)
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.onAutoFetchFinished)
-        self.worker.error.connect(self.onAutoFetchError)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
+        self.worker.signals.finished.connect(self.onAutoFetchFinished)
+        self.worker.signals.error.connect(self.onAutoFetchError)
         self.loadingDialog = loading
-        self.thread.start()
-
+        QThreadPool.globalInstance().start(self.worker)
+
+
+    def _csvCoordinates(self, csv_file):
+        """Return {centreline_id: (lat, lon)} with the first valid coordinates of every ID in the CSV.
+           The result is kept until the file's path, mtime or size changes.
+        """
+        version = file_version(csv_file)
+        cached = self._csv_cache.get("coords")
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Imported here so the main window starts without loading pandas.
+        import pandas as pd
+        df = pd.read_csv(csv_file, usecols=["centreline_id", "latitude", "longitude"], dtype={"centreline_id": str})
+        # Rows whose coordinates do not parse as numbers are skipped.
+        df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
+        df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
+        df = df.dropna(subset=["centreline_id", "latitude", "longitude"])
+        df["centreline_id"] = df["centreline_id"].str.strip()
+        # We only need one (lat, lon) per centreline_id
+        df = df.drop_duplicates("centreline_id")
+        coords = dict(zip(df["centreline_id"], zip(df["latitude"].tolist(), df["longitude"].tolist())))
+        self._csv_cache["coords"] = (version, coords)
+        return coords
 
     def onAutoFetchFinished(self, net_file):
         self.mapLine.setText(os.path.abspath(net_file))
@@ -392,17 +460,11 @@ class MainWindow(QMainWindow):
         loading.show()
         QApplication.processEvents()
 
-        self.csvThread = QThread()
         self.csvWorker = AutoFetchDataWorker()
-        self.csvWorker.moveToThread(self.csvThread)
-        self.csvThread.started.connect(self.csvWorker.run)
-        self.csvWorker.finished.connect(self.onAutoFetchDataFinished)
-        self.csvWorker.error.connect(self.onAutoFetchDataError)
-        self.csvWorker.finished.connect(self.csvThread.quit)
-        self.csvWorker.finished.connect(self.csvWorker.deleteLater)
-        self.csvThread.finished.connect(self.csvThread.deleteLater)
+        self.csvWorker.signals.finished.connect(self.onAutoFetchDataFinished)
+        self.csvWorker.signals.error.connect(self.onAutoFetchDataError)
         self.loadingDialogData = loading
-        self.csvThread.start()
+        QThreadPool.globalInstance().start(self.csvWorker)
 
     def onAutoFetchDataFinished(self, csv_file_path):
         self.csvLine.setText(os.path.abspath(csv_file_path))
@@ -428,30 +490,53 @@ class MainWindow(QMainWindow):
             if not csv_file or not os.path.exists(csv_file):
                 self.show_error("Error", "Please select a valid CSV file.")
                 return
-            overall_min, overall_max = utils.get_overall_time_range(json_file, csv_file)
-            self.overall_min = overall_min
-            self.overall_max = overall_max
-            self.startTimeEdit.setDateTime(QDateTime(overall_min))
-            self.endTimeEdit.setDateTime(QDateTime(overall_max))
-            self.startSlider.setEnabled(not self.customSimCheck.isChecked())
-            self.durationCombo.setEnabled(not self.customSimCheck.isChecked())
-            self.updateSliderRange()
-            self.updateTimeEdits()
-            detailed = utils.get_data_availability_by_intersection(json_file, csv_file)
-            self.updateDetailTable(detailed)
+            # The range and availability only change when the JSON or the CSV does.
+            version = (file_version(json_file), file_version(csv_file))
+            cached = self._csv_cache.get("time_range")
+            if cached is not None and cached[0] == version:
+                self.applyTimeRange(*cached[1])
+                return
+        except Exception as e:
+            self.show_error("Error", str(e))
+            return
+        # Scanning the CSV can take seconds; it runs on the thread pool while the window stays responsive.
+        self.btnLoadRange.setEnabled(False)
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        self.timeRangeWorker = TimeRangeWorker(json_file, csv_file, version)
+        self.timeRangeWorker.signals.finished.connect(self.onTimeRangeLoaded)
+        self.timeRangeWorker.signals.error.connect(self.onTimeRangeError)
+        QThreadPool.globalInstance().start(self.timeRangeWorker)
+
+    def onTimeRangeLoaded(self, version, overall_min, overall_max, detailed):
+        self.timeRangeDone()
+        self._csv_cache["time_range"] = (version, (overall_min, overall_max, detailed))
+        try:
+            self.applyTimeRange(overall_min, overall_max, detailed)
         except Exception as e:
             self.show_error("Error", str(e))
 
+    def onTimeRangeError(self, error_str):
+        self.timeRangeDone()
+        self.show_error("Error", error_str)
+
+    def timeRangeDone(self):
+        QApplication.restoreOverrideCursor()
+        self.btnLoadRange.setEnabled(True)
+
+    def applyTimeRange(self, overall_min, overall_max, detailed):
+        self.overall_min = overall_min
+        self.overall_max = overall_max
+        self.startTimeEdit.setDateTime(QDateTime(overall_min))
+        self.endTimeEdit.setDateTime(QDateTime(overall_max))
+        self.startSlider.setEnabled(not self.customSimCheck.isChecked())
+        self.durationCombo.setEnabled(not self.customSimCheck.isChecked())
+        self.updateSliderRange()
+        self.updateTimeEdits()
+        self.updateDetailTable(detailed)
+
     def updateDetailTable(self, data):
-        rows = []
-        for centreline, intervals in data.items():
-            for interval in intervals:
-                rows.append((centreline, interval["start"], interval["end"]))
-        self.detailTable.setRowCount(len(rows))
-        for i, (cid, st, et) in enumerate(rows):
-            self.detailTable.setItem(i, 0, QTableWidgetItem(cid))
-            self.detailTable.setItem(i, 1, QTableWidgetItem(st))
-            self.detailTable.setItem(i, 2, QTableWidgetItem(et))
+        self.detailModel.setRows([(centreline, interval["start"], interval["end"])
+                                  for centreline, intervals in data.items() for interval in intervals])
 
     # ------------------ SLIDER / TIME EDITS ------------------
     def updateSliderRange(self):
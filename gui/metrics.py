@@ -0,0 +1,17 @@
+# gui/metrics.py
+# Weather metric names shared by the analysis window and the chart logic.
+# Kept free of heavy imports so the window can build its widgets without loading plotly/pandas.
+
+# Mapping of friendly weather metric names to actual column names.
+METRIC_MAP = {
+    "Temperature": "temp",
+    "Visibility": "visibility",
+    "Dew Point": "dew_point",
+    "Humidity": "humidity",
+    "Wind Speed": "wind_speed",
+    "Weather": "weather_main_encoded",
+    "Weekend/Holiday": "is_weekend-holiday"
+}
+
+# List of friendly weather metric names.
+WEATHER_METRICS = list(METRIC_MAP.keys())
@@ -0,0 +1,83 @@
+# gui/plot_cache.py
+# On-disk cache of rendered analysis graphs, so the same plot can be reused across sessions.
+import os
+import gzip
+import json
+import hashlib
+import logging
+
+from config import PLOT_CACHE_DIR
+
+# Eviction limits for the cache directory; least recently used entries go first.
+PLOT_CACHE_MAX_ENTRIES = 200
+PLOT_CACHE_MAX_BYTES = 100 * 1024 * 1024
+# Part of every cache key. Bump it whenever gui/chart_logic.py changes what a rendered graph looks like
+# (handlers, HTML_TEMPLATE), so graphs rendered by older code are not served.
+PLOT_CACHE_VERSION = 1
+
+def plot_cache_label(plot_label):
+    """The stored label of a plot spec: its repr() plus PLOT_CACHE_VERSION and the plotly.js version."""
+    # Imported here; plotly is only loaded once a graph is actually looked up.
+    from plotly.offline import get_plotlyjs_version
+    return repr((PLOT_CACHE_VERSION, get_plotlyjs_version(), plot_label))
+
+def plot_cache_path(mode, plot_label, cache_dir=PLOT_CACHE_DIR):
+    """Return the cache file for a plot spec. The spec must have a stable repr()."""
+    digest = hashlib.sha1(plot_cache_label(plot_label).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, mode, f"{digest}.json.gz")
+
+def load_plot(mode, plot_label, cache_dir=PLOT_CACHE_DIR):
+    """Return the cached (html, notes) for a plot spec, or None on a miss."""
+    path = plot_cache_path(mode, plot_label, cache_dir)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable plot cache entry {path}: {e}")
+        return None
+    if entry.get("label") != plot_cache_label(plot_label):
+        return None
+    try:
+        # Mark the entry as recently used for eviction.
+        os.utime(path)
+    except OSError:
+        pass
+    return entry["html"], entry["notes"]
+
+def store_plot(mode, plot_label, html, notes, cache_dir=PLOT_CACHE_DIR):
+    """Write a rendered plot to the cache and evict old entries if over the limits."""
+    path = plot_cache_path(mode, plot_label, cache_dir)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+            json.dump({"label": plot_cache_label(plot_label), "html": html, "notes": notes}, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write plot cache entry {path}: {e}")
+        return
+    evict_plots(cache_dir)
+
+def evict_plots(cache_dir=PLOT_CACHE_DIR, max_entries=PLOT_CACHE_MAX_ENTRIES, max_bytes=PLOT_CACHE_MAX_BYTES):
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith(".json.gz"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(reverse=True)
+    total_bytes = 0
+    for index, (_, size, path) in enumerate(entries):
+        total_bytes += size
+        if index >= max_entries or total_bytes > max_bytes:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not evict plot cache entry {path}: {e}")
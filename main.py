@@ -1,11 +1,14 @@
 # main.py
 import sys
+import logging
 from PyQt5.QtCore import QCoreApplication, Qt
 QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
 from PyQt5.QtWidgets import QApplication
 from gui.main_window import MainWindow
 
 def main():
+    # Logging is configured once here; library modules only log through their loggers.
+    logging.basicConfig(level=logging.INFO)
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
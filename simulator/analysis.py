@@ -1,59 +1,224 @@
 # simulator/analysis.py
 import os
 import csv
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import numpy as np
 import pandas as pd
+from config import PARSED_DATA_CACHE_DIR
 
-logging.basicConfig(level=logging.DEBUG)
+# Parsed frames are also kept on disk as Parquet when pyarrow is available, so a new session skips the CSV parse.
+try:
+    import pyarrow  # noqa: F401
+    _PARQUET_AVAILABLE = True
+except ImportError:
+    _PARQUET_AVAILABLE = False
+
+# Weather columns present in the intersection CSVs.
+WEATHER_COLUMNS = ("temp", "visibility", "dew_point", "humidity", "wind_speed", "weather_main_encoded")
+# Other columns read from the intersection CSVs besides datetime_bin and the traffic_ columns.
+EXTRA_COLUMNS = WEATHER_COLUMNS + ("is_weekend-holiday",)
+# Maximum number of parsed intersection CSVs kept in memory.
+LOAD_CACHE_SIZE = 64
+# Part of the on-disk parsed frame key. Bump it whenever parse_intersection_csv, is_used_column,
+# EXTRA_COLUMNS or downcast_columns change what a parsed frame holds, so old Parquet files are not served.
+PARSED_FRAME_VERSION = 1
+
+# Parsed frames keyed by (absolute CSV path, mtime), least recently used first.
+_LOAD_CACHE = OrderedDict()
+_LOAD_CACHE_LOCK = threading.Lock()
+
+def intersection_csv_path(local_intersection_name, csv_folder="input"):
+    """Return the path of the CSV file holding an intersection's data."""
+    return os.path.join(csv_folder, f"{local_intersection_name}.csv")
 
 def load_intersection_data(local_intersection_name, csv_folder="input"):
     """Load CSV data for an intersection as a pandas DataFrame.
        CSV file is expected to be named <local_intersection_name>.csv in csv_folder.
+       Parsed frames are cached until the file's mtime changes; a shallow copy is returned so
+       columns added by callers never end up in the cached frame.
     """
-    csv_file = os.path.join(csv_folder, f"{local_intersection_name}.csv")
-    logging.debug(f"Loading data from {csv_file}")
+    csv_file = intersection_csv_path(local_intersection_name, csv_folder)
     try:
-        df = pd.read_csv(csv_file)
-        # Convert datetime_bin column to datetime objects.
-        if "datetime_bin" in df.columns:
-            df["datetime_bin"] = pd.to_datetime(df["datetime_bin"], format="%Y-%m-%d %H:%M:%S", errors='coerce')
-        return df
+        csv_stat = os.stat(csv_file)
+        key = (os.path.abspath(csv_file), csv_stat.st_mtime)
+        with _LOAD_CACHE_LOCK:
+            cached = _LOAD_CACHE.get(key)
+            if cached is not None:
+                _LOAD_CACHE.move_to_end(key)
+                return cached.copy(deep=False)
+        df = load_parsed_frame(csv_file, csv_stat)
+        if df is None:
+            df = parse_intersection_csv(csv_file)
+            store_parsed_frame(csv_file, csv_stat, df)
+        with _LOAD_CACHE_LOCK:
+            _LOAD_CACHE[key] = df
+            if len(_LOAD_CACHE) > LOAD_CACHE_SIZE:
+                _LOAD_CACHE.popitem(last=False)
+        return df.copy(deep=False)
     except Exception as e:
         logging.error(f"Error loading CSV for {local_intersection_name}: {e}")
         raise
 
-def compute_traffic_metrics(df):
+def parse_intersection_csv(csv_file):
+    """Read an intersection CSV into the frame served by load_intersection_data: used columns only,
+       datetime_bin parsed and sorted, numeric columns downcast.
+    """
+    logging.debug(f"Loading data from {csv_file}")
+    # Only the columns the analysis and charts use are parsed.
+    df = pd.read_csv(csv_file, usecols=is_used_column)
+    # Convert datetime_bin column to datetime objects.
+    if "datetime_bin" in df.columns:
+        # cache=True parses each distinct timestamp string once; bins repeat across rows.
+        df["datetime_bin"] = pd.to_datetime(df["datetime_bin"], format="%Y-%m-%d %H:%M:%S", errors='coerce', cache=True)
+        # Sorted by time (NaT last) so timeframes can be found with a binary search.
+        if not df["datetime_bin"].is_monotonic_increasing:
+            df = df.sort_values("datetime_bin", kind="stable", ignore_index=True)
+    downcast_columns(df)
+    return df
+
+def _parsed_frame_prefix(csv_file):
+    return hashlib.sha1(os.path.abspath(csv_file).encode("utf-8")).hexdigest()
+
+def parsed_frame_path(csv_file, csv_stat, cache_dir=PARSED_DATA_CACHE_DIR):
+    """Return the Parquet file caching the parsed frame of a CSV. The name hashes the CSV's path, mtime
+       and size and PARSED_FRAME_VERSION, so any change to the file or to the parsing gets a new entry.
+    """
+    version = f"{csv_stat.st_mtime!r}|{csv_stat.st_size}|{PARSED_FRAME_VERSION}"
+    digest = hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{_parsed_frame_prefix(csv_file)}-{digest}.parquet")
+
+def load_parsed_frame(csv_file, csv_stat, cache_dir=PARSED_DATA_CACHE_DIR):
+    """Return the cached parsed frame of a CSV, or None on a miss."""
+    if not _PARQUET_AVAILABLE:
+        return None
+    path = parsed_frame_path(csv_file, csv_stat, cache_dir)
+    try:
+        return pd.read_parquet(path, engine="pyarrow")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable parsed data cache entry {path}: {e}")
+        return None
+
+def store_parsed_frame(csv_file, csv_stat, df, cache_dir=PARSED_DATA_CACHE_DIR):
+    """Write a parsed frame to the on-disk cache and drop the CSV's entries for older versions.
+       Failures only cost the next session a re-parse.
+    """
+    if not _PARQUET_AVAILABLE:
+        return
+    path = parsed_frame_path(csv_file, csv_stat, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Per-thread temp name; analyses of the same CSV may store it concurrently.
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        df.to_parquet(temp_path, engine="pyarrow", compression="zstd")
+        os.replace(temp_path, path)
+        prefix = _parsed_frame_prefix(csv_file) + "-"
+        for entry in os.scandir(cache_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith(".parquet") and entry.path != path:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    # Another thread already removed it.
+                    pass
+    except Exception as e:
+        logging.warning(f"Could not write parsed data cache entry {path}: {e}")
+
+def is_used_column(col):
+    """Whether a CSV column is needed by the analysis or the charts."""
+    return col == "datetime_bin" or col.startswith("traffic_") or col in EXTRA_COLUMNS
+
+def downcast_columns(df):
+    """Narrow dtypes in place: traffic counts to the smallest unsigned integer (or float32 when they
+       hold NaN), weather readings to float32. Columns that are already narrow are left alone.
+    """
+    for col in df.columns:
+        if col.startswith("traffic_"):
+            if df[col].dtype == np.int64:
+                df[col] = pd.to_numeric(df[col], downcast="unsigned")
+            elif df[col].dtype == np.float64:
+                df[col] = df[col].astype(np.float32)
+        elif col in WEATHER_COLUMNS and df[col].dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
+
+def traffic_reductions(values):
+    """Per-lane means and per-row totals of a (rows, lanes) float array of traffic counts.
+       Lane means skip NaN like Series.mean(); row totals count NaN as 0 like DataFrame.sum(axis=1).
+       Both come from the same NaN-filled array, so the counts are only scanned once.
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = filled.sum(axis=0) / valid.sum(axis=0)
+    return means, filled.sum(axis=1)
+
+def traffic_columns(df):
+    """Names of the traffic columns of a frame, i.e. those starting with 'traffic_'."""
+    return [col for col in df.columns if col.startswith("traffic_")]
+
+def compute_traffic_metrics(df, traffic_cols=None):
     """Compute traffic metrics from DataFrame.
-       Traffic columns are those starting with 'traffic_'.
+       Traffic columns are those starting with 'traffic_'; pass traffic_cols when they are already known.
        Returns a dict with average per lane and overall average.
     """
-    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
+    if traffic_cols is None:
+        traffic_cols = traffic_columns(df)
     if not traffic_cols:
         raise ValueError("No traffic columns found in data.")
-    metrics = {}
-    for col in traffic_cols:
-        metrics[col] = df[col].mean()
-    metrics["total_traffic_avg"] = df[traffic_cols].sum(axis=1).mean()
+    means, totals = traffic_reductions(df[traffic_cols].to_numpy(dtype=float))
+    return traffic_metrics(traffic_cols, means, totals)
+
+def traffic_metrics(traffic_cols, means, totals):
+    """The metrics dict returned by compute_traffic_metrics, from the output of traffic_reductions."""
+    metrics = dict(zip(traffic_cols, means.tolist()))
+    metrics["total_traffic_avg"] = float(totals.mean())
     return metrics
 
-def compute_weather_traffic_correlation(df, weather_metric="humidity"):
+def traffic_weather_correlation(totals, weather):
+    """Pearson correlation between row totals and weather readings, over rows where both are present.
+       Matches Series.corr: NaN when fewer than two rows remain or either side is constant.
+    """
+    valid = ~(np.isnan(totals) | np.isnan(weather))
+    t = totals[valid]
+    w = weather[valid]
+    if len(t) < 2:
+        return np.nan
+    t = t - t.mean()
+    w = w - w.mean()
+    denom = np.sqrt((t @ t) * (w @ w))
+    if denom == 0:
+        return np.nan
+    return float((t @ w) / denom)
+
+def compute_weather_traffic_correlation(df, weather_metric="humidity", traffic_cols=None):
     """Compute Pearson correlation between total traffic and a given weather metric.
     """
-    traffic_cols = [col for col in df.columns if col.startswith("traffic_")]
+    if traffic_cols is None:
+        traffic_cols = traffic_columns(df)
     if weather_metric not in df.columns:
         raise ValueError(f"Weather metric '{weather_metric}' not found in data.")
-    total_traffic = df[traffic_cols].sum(axis=1)
-    correlation = total_traffic.corr(df[weather_metric])
-    return correlation
+    _, totals = traffic_reductions(df[traffic_cols].to_numpy(dtype=float))
+    return traffic_weather_correlation(totals, df[weather_metric].to_numpy(dtype=float))
 
-def get_data_in_timeframe(df, start_dt, end_dt):
-    """Filter the DataFrame for rows where datetime_bin is between start_dt (inclusive) and end_dt (exclusive)."""
+def timeframe_rows(df, start_dt, end_dt):
+    """Rows of df whose datetime_bin is between start_dt (inclusive) and end_dt (exclusive), as a slice
+       that can index .iloc or a column's ndarray. df must be sorted by datetime_bin with NaT last, as
+       returned by load_intersection_data; the bounds are then found by binary search, without a row mask.
+    """
     if "datetime_bin" not in df.columns:
         raise ValueError("datetime_bin column missing in data.")
-    filtered = df[(df["datetime_bin"] >= start_dt) & (df["datetime_bin"] < end_dt)]
-    return filtered
+    values = df["datetime_bin"].to_numpy()
+    start, end = np.searchsorted(values, [np.datetime64(start_dt), np.datetime64(end_dt)])
+    return slice(int(start), int(end))
+
+def get_data_in_timeframe(df, start_dt, end_dt):
+    """Filter the DataFrame for rows where datetime_bin is between start_dt (inclusive) and end_dt (exclusive)."""
+    # A shallow copy, so callers can add columns without touching df.
+    return df.iloc[timeframe_rows(df, start_dt, end_dt)].copy(deep=False)
 
 def analyze_intersection(local_intersection_name, start_dt, end_dt, csv_folder="input", weather_metric="humidity"):
     """Load data for a given intersection, filter it by time, and compute metrics.
@@ -62,17 +227,27 @@ def analyze_intersection(local_intersection_name, start_dt, end_dt, csv_folder="
          - traffic_metrics (averages for each lane and overall)
          - weather_traffic_correlation (correlation coefficient between total traffic and the weather metric)
          - missing_data (True if no data exists in the timeframe)
+       Only the traffic columns and the weather metric are extracted for the timeframe; the row totals
+       feed both the metrics and the correlation.
     """
     logging.debug(f"Analyzing intersection: {local_intersection_name} for timeframe {start_dt} to {end_dt}")
     df = load_intersection_data(local_intersection_name, csv_folder)
-    filtered = get_data_in_timeframe(df, start_dt, end_dt)
-    missing_data = filtered.empty
+    rows = timeframe_rows(df, start_dt, end_dt)
+    traffic_cols = traffic_columns(df)
+    # Rows and columns are selected in one positional step, so the full-length column subset is never built.
+    values = df.iloc[rows, df.columns.get_indexer(traffic_cols)].to_numpy(dtype=float)
+    missing_data = len(values) == 0
     metrics = {}
     correlation = None
     if not missing_data:
-        metrics = compute_traffic_metrics(filtered)
+        if not traffic_cols:
+            raise ValueError("No traffic columns found in data.")
+        means, totals = traffic_reductions(values)
+        metrics = traffic_metrics(traffic_cols, means, totals)
         try:
-            correlation = compute_weather_traffic_correlation(filtered, weather_metric)
+            if weather_metric not in df.columns:
+                raise ValueError(f"Weather metric '{weather_metric}' not found in data.")
+            correlation = traffic_weather_correlation(totals, df[weather_metric].to_numpy()[rows].astype(float))
         except Exception as e:
             logging.error(f"Error computing correlation for {local_intersection_name}: {e}")
             correlation = None
@@ -1,8 +1,47 @@
 import os
 import math
+import time
+import shutil
+import hashlib
+import logging
 import requests
+import threading
 import subprocess
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import OSM_CACHE_DIR
+
+# Bytes written per chunk when streaming downloads to disk.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# (connect, read) timeouts in seconds for Overpass queries; large areas take minutes to be served.
+OVERPASS_TIMEOUT = (10, 300)
+# (connect, read) timeouts in seconds for CKAN requests; the datastore dump is large.
+CKAN_TIMEOUT = (10, 300)
+# Seconds an Overpass download is reused for the same bounding box before it is fetched again.
+OSM_CACHE_TTL = 24 * 60 * 60
+# Grid in degrees (~500 m) the buffered bounding box is widened to, so nearby requests share a download.
+BBOX_GRID_DEG = 0.005
+# Overpass and CKAN answer 429/5xx under load; these are retried with exponential backoff,
+# waiting for Retry-After when the server sends it. Read timeouts are not retried: a query that
+# already ran for the full read timeout would only keep the server busy again.
+HTTP_RETRY = Retry(total=6, read=0, backoff_factor=2.0, status_forcelist=(429, 502, 503, 504),
+                   allowed_methods=frozenset(["GET", "POST"]), respect_retry_after_header=True)
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def http_session():
+    """Return the shared requests session that retries transient failures and reuses connections."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(max_retries=HTTP_RETRY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+        return _SESSION
 
 def download_osm_data(coordinates, radius_km=5, osm_output=None):
     """
@@ -35,6 +74,28 @@ def download_osm_data(coordinates, radius_km=5, osm_output=None):
     min_lon -= lon_offset
     max_lon += lon_offset
     
+    # Snap outwards to the grid; the area only grows, by at most one grid step per side.
+    g = BBOX_GRID_DEG
+    min_lat = round(math.floor(min_lat / g) * g, 6)
+    max_lat = round(math.ceil(max_lat / g) * g, 6)
+    min_lon = round(math.floor(min_lon / g) * g, 6)
+    max_lon = round(math.ceil(max_lon / g) * g, 6)
+    
+    if osm_output is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        osm_output = os.path.join("data", f"map_area_{timestamp}.osm")
+    os.makedirs(os.path.dirname(osm_output), exist_ok=True)
+    
+    # A recent download of the same area is reused instead of querying Overpass again. The interpreter
+    # endpoint sends no Last-Modified/ETag validators, so freshness is decided by OSM_CACHE_TTL alone.
+    cache_path = osm_cache_path(min_lat, min_lon, max_lat, max_lon, radius_km)
+    try:
+        if os.path.getmtime(cache_path) > time.time() - OSM_CACHE_TTL:
+            link_or_copy(cache_path, osm_output)
+            return osm_output
+    except OSError:
+        pass
+    
     overpass_url = "https://overpass-api.de/api/interpreter"
     overpass_query = f"""
     [out:xml];
@@ -46,19 +107,43 @@ def download_osm_data(coordinates, radius_km=5, osm_output=None):
     out body;
     """
     
-    response = requests.post(overpass_url, data=overpass_query)
-    response.raise_for_status()
-    
-    if osm_output is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        osm_output = os.path.join("data", f"map_area_{timestamp}.osm")
-    os.makedirs(os.path.dirname(osm_output), exist_ok=True)
-    
-    with open(osm_output, "w", encoding="utf-8") as f:
-        f.write(response.text)
+    # Streamed to disk in chunks; the whole response is never decoded into one string.
+    # The connection is released even when the status check fails.
+    with http_session().post(overpass_url, data=overpass_query, stream=True, timeout=OVERPASS_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(osm_output, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
     
+    store_osm_cache(osm_output, cache_path)
     return osm_output
 
+def osm_cache_path(min_lat, min_lon, max_lat, max_lon, radius_km, cache_dir=OSM_CACHE_DIR):
+    """Return the cache file for an Overpass download of a bounding box (rounded to 1e-4 degrees) and radius."""
+    bbox = f"{min_lat:.4f},{min_lon:.4f},{max_lat:.4f},{max_lon:.4f},{radius_km}"
+    digest = hashlib.blake2b(bbox.encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"{digest}.osm")
+
+def link_or_copy(src, dst):
+    """Replace dst with src, hard-linked when possible to avoid a second copy on disk."""
+    temp_path = dst + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(src, temp_path)
+    except OSError:
+        shutil.copyfile(src, temp_path)
+    os.replace(temp_path, dst)
+
+def store_osm_cache(osm_file, cache_path):
+    """Put a downloaded OSM file into the cache."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        link_or_copy(osm_file, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache OSM download {osm_file}: {e}")
+
 def convert_to_sumo_network(osm_file, net_output=None):
     """
     Convert an OSM file to a SUMO network using netconvert.
@@ -121,13 +206,14 @@ def fetch_csv_data(data_folder="data"):
     package_url = base_url + "/api/3/action/package_show"
     params = {"id": "traffic-volumes-at-intersections-for-all-modes"}
     
-    package = requests.get(package_url, params=params).json()
+    session = http_session()
+    package = session.get(package_url, params=params, timeout=CKAN_TIMEOUT).json()
     
     for resource in package["result"]["resources"]:
         if resource["name"] == "tmc_raw_data_2020_2029":
             if resource["datastore_active"]:
                 dump_url = base_url + "/datastore/dump/" + resource["id"]
-                csv_data = requests.get(dump_url).text
+                csv_data = session.get(dump_url, timeout=CKAN_TIMEOUT).text
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"tmc_raw_data_2020_2029_{timestamp}.csv"
                 file_path = os.path.join(data_folder, filename)
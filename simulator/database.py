@@ -1,10 +1,18 @@
 import os
 import json
-from config import PROCESSED_DB_PATH
+import atexit
+import sqlite3
+import threading
+from config import PROCESSED_DB_PATH, PROCESSED_DB_SQLITE_PATH
 
-def load_processed_db():
-    if not os.path.exists("data"):
-        os.makedirs("data")
+# One connection per process; junction records are read and upserted by key instead of
+# rewriting the whole database on every update.
+_CONN = None
+_CONN_LOCK = threading.Lock()
+# Upserts since the last commit; flush_processed_db commits them in one transaction.
+_DIRTY = False
+
+def load_legacy_json_db():
     if os.path.exists(PROCESSED_DB_PATH):
         try:
             if os.path.getsize(PROCESSED_DB_PATH) == 0:
@@ -16,11 +24,69 @@ def load_processed_db():
             return {}
     return {}
 
-def update_processed_db(junction_id, record):
-    db = load_processed_db()
-    db[junction_id] = record
+def _connection():
+    """Open the SQLite DB on first use, importing records from the old processed_data.json once."""
+    global _CONN
+    if _CONN is None:
+        os.makedirs(os.path.dirname(PROCESSED_DB_SQLITE_PATH), exist_ok=True)
+        conn = sqlite3.connect(PROCESSED_DB_SQLITE_PATH, check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS junctions (id TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        if conn.execute("SELECT 1 FROM junctions LIMIT 1").fetchone() is None:
+            legacy = load_legacy_json_db()
+            conn.executemany(
+                "INSERT OR IGNORE INTO junctions (id, record) VALUES (?, ?)",
+                ((str(k), json.dumps(v)) for k, v in legacy.items())
+            )
+        conn.commit()
+        _CONN = conn
+    return _CONN
+
+def load_processed_db():
+    """Return every processed junction record as {junction_id: record}."""
+    try:
+        with _CONN_LOCK:
+            rows = _connection().execute("SELECT id, record FROM junctions").fetchall()
+        return {junction_id: json.loads(record) for junction_id, record in rows}
+    except Exception as e:
+        print("Error loading processed junction DB:", e)
+        return {}
+
+def load_record(junction_id):
+    """Return the processed record for one junction, or None if it has not been processed."""
     try:
-        with open(PROCESSED_DB_PATH, "w") as f:
-            json.dump(db, f, indent=4)
+        with _CONN_LOCK:
+            row = _connection().execute(
+                "SELECT record FROM junctions WHERE id = ?", (str(junction_id),)
+            ).fetchone()
     except Exception as e:
-        print("Error writing to processed_data.json:", e)
+        print("Error loading processed junction DB:", e)
+        return None
+    return json.loads(row[0]) if row else None
+
+def upsert_record(junction_id, record):
+    """Insert or replace a junction record; it is visible immediately and persisted by flush_processed_db."""
+    global _DIRTY
+    try:
+        with _CONN_LOCK:
+            _connection().execute(
+                "INSERT INTO junctions (id, record) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET record = excluded.record",
+                (str(junction_id), json.dumps(record))
+            )
+            _DIRTY = True
+    except Exception as e:
+        print("Error writing to processed junction DB:", e)
+
+@atexit.register
+def flush_processed_db():
+    """Commit pending upserts in a single transaction (one disk sync instead of one per junction)."""
+    global _DIRTY
+    try:
+        with _CONN_LOCK:
+            if _DIRTY:
+                _CONN.commit()
+                _DIRTY = False
+    except Exception as e:
+        print("Error writing to processed junction DB:", e)
+
+update_processed_db = upsert_record
@@ -1,6 +1,13 @@
 import math
+import logging
+import weakref
 import sumolib
 
+logger = logging.getLogger(__name__)
+
+# Per-network node lookup structures, built on first use and dropped with the network.
+_NODE_INDEX = weakref.WeakKeyDictionary()
+
 def is_edge_for_cars(edge):
     etype = edge.getType()
     return etype and "highway" in etype and "footway" not in etype
@@ -26,65 +33,112 @@ def map_junction_edges(net, junction_id):
         raise ValueError(f"Junction '{junction_id}' not found in network: {e}")
     
     mapping = {"incoming": {}, "outgoing": {}}
+    jx, jy = junction.getCoord()[:2]
     
     for edge in junction.getIncoming():
         if not is_edge_for_cars(edge):
             continue
-        from_node = edge.getFromNode()
+        fx, fy = edge.getFromNode().getCoord()[:2]
         # REVERSED: calculate FROM junction TO edge start
-        angle = compute_bearing(junction.getCoord()[0], junction.getCoord()[1],
-                                from_node.getCoord()[0], from_node.getCoord()[1])
-        direction = classify_direction(angle)
+        direction = classify_direction(compute_bearing(jx, jy, fx, fy))
         mapping["incoming"].setdefault(direction, []).append(edge.getID())
     
     for edge in junction.getOutgoing():
         if not is_edge_for_cars(edge):
             continue
-        to_node = edge.getToNode()
-        angle = compute_bearing(junction.getCoord()[0], junction.getCoord()[1],
-                                to_node.getCoord()[0], to_node.getCoord()[1])
-        direction = classify_direction(angle)
+        tx, ty = edge.getToNode().getCoord()[:2]
+        direction = classify_direction(compute_bearing(jx, jy, tx, ty))
         mapping["outgoing"].setdefault(direction, []).append(edge.getID())
     
-    # DEBUG CODE
-    print(f"\n=== DEBUG: Junction {junction_id} at {junction.getCoord()} ===")
-    print("INCOMING EDGES:")
-    for direction, edges in mapping["incoming"].items():
-        for edge_id in edges:
-            edge = net.getEdge(edge_id)
-            from_node = edge.getFromNode()
-            angle = compute_bearing(from_node.getCoord()[0], from_node.getCoord()[1],
-                                    junction.getCoord()[0], junction.getCoord()[1])
-            print(f"  {direction}: {edge_id} (angle: {angle:.1f}°)")
-            print(f"    From: {from_node.getCoord()} -> To: {junction.getCoord()}")
+    # Edge diagnostics; skipped entirely (including the extra coordinate lookups) unless DEBUG is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"=== Junction {junction_id} at {(jx, jy)} ===")
+        logger.debug("INCOMING EDGES:")
+        for direction, edges in mapping["incoming"].items():
+            for edge_id in edges:
+                edge = net.getEdge(edge_id)
+                fx, fy = edge.getFromNode().getCoord()[:2]
+                angle = compute_bearing(fx, fy, jx, jy)
+                logger.debug(f"  {direction}: {edge_id} (angle: {angle:.1f}°)")
+                logger.debug(f"    From: {(fx, fy)} -> To: {(jx, jy)}")
     
-    print("OUTGOING EDGES:")
-    for direction, edges in mapping["outgoing"].items():
-        for edge_id in edges:
-            edge = net.getEdge(edge_id)
-            to_node = edge.getToNode()
-            angle = compute_bearing(junction.getCoord()[0], junction.getCoord()[1],
-                                    to_node.getCoord()[0], to_node.getCoord()[1])
-            print(f"  {direction}: {edge_id} (angle: {angle:.1f}°)")
-            print(f"    From: {junction.getCoord()} -> To: {to_node.getCoord()}")
+        logger.debug("OUTGOING EDGES:")
+        for direction, edges in mapping["outgoing"].items():
+            for edge_id in edges:
+                edge = net.getEdge(edge_id)
+                tx, ty = edge.getToNode().getCoord()[:2]
+                angle = compute_bearing(jx, jy, tx, ty)
+                logger.debug(f"  {direction}: {edge_id} (angle: {angle:.1f}°)")
+                logger.debug(f"    From: {(jx, jy)} -> To: {(tx, ty)}")
     
     return mapping
 
-def find_intersection(net, target_lon, target_lat, tolerance=10.0):
-    target_x, target_y = net.convertLonLat2XY(target_lon, target_lat)
-    closest_node = None
-    min_distance = float('inf')
-    for node in net.getNodes():
-        node_x, node_y = node.getCoord()
-        distance = math.hypot(node_x - target_x, node_y - target_y)
-        if distance < min_distance:
-            min_distance = distance
-            closest_node = node
-    if closest_node is None:
+def node_index(net):
+    """
+    Return (nodes, coords, tree) for a network, built once per net so repeated lookups skip the node scan.
+    tree is a scipy cKDTree when scipy is installed, otherwise None and coords is searched with numpy.
+    """
+    index = _NODE_INDEX.get(net)
+    if index is None:
+        # Imported here so loading this module (and the main window) does not pull in numpy/scipy.
+        import numpy as np
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            cKDTree = None
+        nodes = list(net.getNodes())
+        coords = np.array([node.getCoord()[:2] for node in nodes], dtype=float).reshape(-1, 2)
+        tree = cKDTree(coords) if cKDTree is not None and nodes else None
+        index = (nodes, coords, tree)
+        _NODE_INDEX[net] = index
+    return index
+
+def nearest_nodes(net, xs, ys):
+    """Return a (node, distance) pair for the network node closest to each (x, y) point."""
+    import numpy as np
+    nodes, coords, tree = node_index(net)
+    if not nodes:
         raise ValueError("No nodes found in the network.")
-    if min_distance > tolerance:
-        prompt = (f"Warning: Closest node (ID: {closest_node.getID()}) is {min_distance:.2f}m away "
+    points = np.column_stack((np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)))
+    if tree is not None:
+        distances, indices = tree.query(points)
+    else:
+        # One vectorised pass over the nodes per point; a full points x nodes matrix could be huge.
+        indices = []
+        distances = []
+        for x, y in points:
+            d = np.hypot(coords[:, 0] - x, coords[:, 1] - y)
+            i = d.argmin()
+            indices.append(i)
+            distances.append(d[i])
+    return [(nodes[int(i)], float(d)) for i, d in zip(indices, distances)]
+
+def lonlat_to_xy(net, lons, lats):
+    """Vectorised net.convertLonLat2XY: projects all lon/lat pairs with a single pyproj call."""
+    import numpy as np
+    xs, ys = net.getGeoProj()(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    x_off, y_off = net.getLocationOffset()
+    return np.asarray(xs) + x_off, np.asarray(ys) + y_off
+
+def check_tolerance(node, distance, tolerance=10.0):
+    """Return the node's ID, asking the user to confirm when it lies farther than tolerance metres away."""
+    if distance > tolerance:
+        prompt = (f"Warning: Closest node (ID: {node.getID()}) is {distance:.2f}m away "
                   f"(tolerance {tolerance}m). Proceed? (y/n): ")
         if input(prompt).strip().lower() != 'y':
             raise ValueError("User declined to proceed with out-of-tolerance intersection.")
-    return closest_node.getID()
+    return node.getID()
+
+def find_intersection(net, target_lon, target_lat, tolerance=10.0):
+    target_x, target_y = net.convertLonLat2XY(target_lon, target_lat)
+    node, distance = nearest_nodes(net, [target_x], [target_y])[0]
+    return check_tolerance(node, distance, tolerance)
+
+def find_intersections(net, lonlats):
+    """
+    Locate the closest node for many (lon, lat) pairs at once.
+    Returns (node, distance) pairs in input order; tolerance is left to check_tolerance.
+    """
+    lons, lats = zip(*lonlats)
+    xs, ys = lonlat_to_xy(net, lons, lats)
+    return nearest_nodes(net, xs, ys)
@@ -1,97 +1,182 @@
 import os
-import csv
+import re
+import sys
 import json
 import xml.etree.ElementTree as ET
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from xml.sax.saxutils import XMLGenerator
+from datetime import datetime, timedelta
 import sumolib
 from . import database, edge_mapping, utils
 
-def time_overlaps(intervals, sim_start, sim_end):
+# Rows parsed per pandas chunk when reading the traffic CSV for a simulation.
+CSV_CHUNK_ROWS = 100_000
+
+# Count columns: <approach>[_appr]_<vehicle>_<movement>, e.g. n_appr_cars_r or s_truck_t.
+# Approach, "appr" and movement may be in either case; the vehicle token must be lowercase.
+FLOW_COLUMN_RE = re.compile(r"([nsewNSEW])(?:_(?i:appr))?_(cars|truck|bus)_([rtlRTL])")
+VEHICLE_TYPES = {"cars": "car", "truck": "truck", "bus": "bus"}
+_EPOCH = datetime(1970, 1, 1)
+
+def merge_intervals(starts, ends):
     """
-    Returns True if the simulation window [sim_start, sim_end]
-    overlaps with any interval in the intervals list.
-    Each interval is a dict with "start" and "end" as strings.
+    Merges overlapping or touching intervals given as int64 epoch-second arrays.
+    Returns (merged_starts, merged_ends), sorted by start.
     """
-    for interval in intervals:
-        try:
-            interval_start = datetime.strptime(interval["start"], "%Y-%m-%d %H:%M:%S")
-            interval_end = datetime.strptime(interval["end"], "%Y-%m-%d %H:%M:%S")
-        except Exception:
-            continue
-        if sim_start < interval_end and sim_end > interval_start:
-            return True
-    return False
+    import numpy as np
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = ends[order]
+    # An interval opens a new block when it starts after every earlier interval has ended.
+    reach = np.maximum.accumulate(ends)
+    opens = np.empty(len(starts), dtype=bool)
+    opens[0] = True
+    opens[1:] = starts[1:] > reach[:-1]
+    block_starts = np.flatnonzero(opens)
+    return starts[block_starts], np.maximum.reduceat(ends, block_starts)
+
+def format_epoch(seconds):
+    """Formats epoch seconds from epoch_seconds back to "%Y-%m-%d %H:%M:%S"."""
+    return (_EPOCH + timedelta(seconds=int(seconds))).strftime("%Y-%m-%d %H:%M:%S")
+
+def epoch_seconds(dt):
+    """
+    Whole seconds since 1970-01-01 on dt's own clock. Naive datetimes are not shifted to
+    local time, so differences match plain datetime subtraction across DST changes.
+    """
+    if dt.tzinfo is not None:
+        return int(dt.timestamp())
+    return (dt - _EPOCH) // timedelta(seconds=1)
+
+def centreline_key(value):
+    """Canonical centreline_id key: stripped and interned, so the JSON and CSV sides share one string."""
+    return sys.intern(str(value).strip())
+
+def parse_row_times(row):
+    """
+    Parses a CSV row's start_time/end_time once and stores them as "_start_dt"/"_end_dt",
+    plus integer epoch seconds as "_start_s"/"_end_s" for the flow generation window checks.
+    All are None when either timestamp is missing or malformed.
+    """
+    try:
+        row["_start_dt"] = datetime.fromisoformat(row["start_time"])
+        row["_end_dt"] = datetime.fromisoformat(row["end_time"])
+        row["_start_s"] = epoch_seconds(row["_start_dt"])
+        row["_end_s"] = epoch_seconds(row["_end_dt"])
+    except Exception:
+        row["_start_dt"] = row["_end_dt"] = row["_start_s"] = row["_end_s"] = None
+    return row
+
+def flow_columns(keys):
+    """Returns (key, prefix, vehicle, movement) for each count column among the CSV keys."""
+    columns = []
+    for key in keys:
+        match = FLOW_COLUMN_RE.fullmatch(key)
+        if match:
+            prefix, vehicle_str, movement = match.groups()
+            columns.append((key, prefix.lower(), VEHICLE_TYPES[vehicle_str], movement.lower()))
+    return columns
 
 def generate_flows_for_intersection(mapping, rows, intersection_id, simulation_start_dt, simulation_end_dt):
-    flows = []
+    """Yields the attributes of each <flow> for an intersection's rows in the simulation window."""
     incoming_mapping = {"n": "north", "s": "south", "e": "east", "w": "west"}
     outgoing_mapping = {
         "r": {"n": "west", "e": "north", "s": "east", "w": "south"},
         "t": {"n": "south", "e": "west", "s": "north", "w": "east"},
         "l": {"n": "east", "e": "south", "s": "west", "w": "north"}
     }
-    ignore_keys = {
-        "_id", "count_id", "count_date", "location_name", "longitude", "latitude", 
-        "centreline_type", "centreline_id", "px", "start_time", "end_time"
-    }
+    if not rows:
+        return
+    # All rows come from the same CSV, so each count column is resolved to its edges once.
+    # edges is None when the mapping lacks a side; that is only an error once the column carries traffic.
+    columns = []
+    for key, prefix, vehicle, movement in flow_columns(rows[0].keys()):
+        from_dir = incoming_mapping[prefix]
+        to_dir = outgoing_mapping[movement][prefix]
+        if mapping["incoming"].get(from_dir) and mapping["outgoing"].get(to_dir):
+            edges = (mapping["incoming"][from_dir][0], mapping["outgoing"][to_dir][0])
+        else:
+            edges = None
+        columns.append((key, f"{intersection_id}_{key}_", vehicle, from_dir, to_dir, edges))
     
+    # Rows carry epoch seconds parsed at load time (see parse_row_times); the window check is integer-only.
+    sim_start_s = epoch_seconds(simulation_start_dt)
+    sim_end_s = epoch_seconds(simulation_end_dt)
     for row in rows:
-        try:
-            row_start = datetime.fromisoformat(row["start_time"])
-            row_end = datetime.fromisoformat(row["end_time"])
-        except Exception:
-            continue
-        if row_start < simulation_start_dt or row_start >= simulation_end_dt:
+        start_s = row["_start_s"]
+        if start_s is None or start_s < sim_start_s or start_s >= sim_end_s:
             continue
-        base_time = int((row_start - simulation_start_dt).total_seconds())
-        duration = int((row_end - row_start).total_seconds())
-        for key, value in row.items():
-            if key in ignore_keys:
-                continue
-            parts = key.split("_")
-            if len(parts) == 3:
-                prefix, vehicle_str, movement = parts
-            elif len(parts) == 4:
-                prefix, appr, vehicle_str, movement = parts
-                if appr.lower() != "appr":
-                    continue
-            else:
-                continue
-            if vehicle_str == "cars":
-                vehicle = "car"
-            elif vehicle_str in ("truck", "bus"):
-                vehicle = vehicle_str
-            else:
-                continue
+        base_time = start_s - sim_start_s
+        duration = row["_end_s"] - start_s
+        begin = str(base_time)
+        end = str(base_time + duration)
+        for key, id_prefix, vehicle, from_dir, to_dir, edges in columns:
             try:
-                count = int(value)
+                count = int(row[key])
             except Exception:
                 continue
             if count <= 0:
                 continue
-            from_dir = incoming_mapping.get(prefix.lower())
-            to_dir = outgoing_mapping.get(movement.lower(), {}).get(prefix.lower())
-            if not from_dir or not to_dir:
-                continue
-            if not mapping["incoming"].get(from_dir) or not mapping["outgoing"].get(to_dir):
+            if edges is None:
                 raise ValueError(
                     f"Incomplete edge mapping for key '{key}': "
                     f"missing incoming '{from_dir}' or outgoing '{to_dir}'."
                 )
-            from_edge = mapping["incoming"][from_dir][0]
-            to_edge = mapping["outgoing"][to_dir][0]
-            flow_id = f"{intersection_id}_{key}_{base_time}"
-            flow_elem = ET.Element("flow", {
-                "id": flow_id,
-                "begin": str(base_time),
-                "end": str(base_time + duration),
+            from_edge, to_edge = edges
+            yield {
+                "id": id_prefix + begin,
+                "begin": begin,
+                "end": end,
                 "number": str(count),
                 "from": from_edge,
                 "to": to_edge,
                 "type": vehicle
-            })
-            flows.append(flow_elem)
-    return flows
+            }
+
+def load_rows_by_id(data_csv_file, wanted):
+    """
+    Groups CSV rows by centreline_id, keeping only the ids in wanted.
+    pandas' C parser reads the file in chunks; each chunk is filtered before any row dicts are built.
+    Cells stay strings (empty cells included) as the flow generation expects.
+    """
+    import pandas as pd
+    data_rows_by_id = {}
+    chunks = pd.read_csv(data_csv_file, dtype=str, keep_default_na=False, engine="c",
+                         chunksize=CSV_CHUNK_ROWS)
+    for chunk in chunks:
+        if "centreline_id" not in chunk.columns:
+            raise ValueError(f"CSV file '{data_csv_file}' is missing 'centreline_id' column.")
+        if "start_time" not in chunk.columns:
+            raise ValueError(f"CSV file '{data_csv_file}' is missing 'start_time' column.")
+        keys = chunk["centreline_id"].str.strip()
+        mask = keys.isin(wanted)
+        if not mask.any():
+            continue
+        for key, group in chunk[mask].groupby(keys[mask], sort=False):
+            records = [parse_row_times(row) for row in group.to_dict("records")]
+            data_rows_by_id.setdefault(sys.intern(key), []).extend(records)
+    return data_rows_by_id
+
+def write_routes(route_file, vehicle_params, flows):
+    """
+    Streams the routes file to disk: vType definitions followed by the flows.
+    No element tree is built, so memory does not grow with the number of flows.
+    """
+    with open(route_file, "w", encoding="utf-8") as f:
+        writer = XMLGenerator(f, encoding="utf-8", short_empty_elements=True)
+        writer.startDocument()
+        writer.startElement("routes", {})
+        for vtype, params in vehicle_params.items():
+            writer.ignorableWhitespace("\n    ")
+            writer.startElement("vType", {"id": vtype, **params})
+            writer.endElement("vType")
+        for flow in flows:
+            writer.ignorableWhitespace("\n    ")
+            writer.startElement("flow", flow)
+            writer.endElement("flow")
+        writer.ignorableWhitespace("\n")
+        writer.endElement("routes")
+        writer.endDocument()
 
 def simulate_simulation(input_json_file, map_file, data_csv_file,
                        simulation_start_dt, simulation_end_dt,
@@ -126,6 +211,9 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
     :return: Tuple (route_file, warnings)
     """
     from . import database  # ensure we import database inside function if needed
+    import numpy as np
+    sim_start_s = epoch_seconds(simulation_start_dt)
+    sim_end_s = epoch_seconds(simulation_end_dt)
 
     # Load intersections from JSON
     try:
@@ -133,15 +221,22 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
     except Exception as e:
         raise RuntimeError(f"Error loading JSON: {e}")
     
+    # The CSV is parsed on a worker thread while sumolib reads the network; pandas' tokenizer
+    # releases the GIL for much of its work, so the two loads overlap.
+    wanted = {centreline_key(inter["centreline_id"]) for inter in intersections if inter.get("centreline_id")}
+    loader = ThreadPoolExecutor(max_workers=1)
+    rows_future = loader.submit(load_rows_by_id, data_csv_file, wanted)
+    loader.shutdown(wait=False)
+    
     # Load SUMO network
     try:
         net = sumolib.net.readNet(map_file)
     except Exception as e:
+        # Don't return while the CSV is still being parsed: drop it if it has not started, else let it finish.
+        rows_future.cancel()
+        wait([rows_future])
         raise RuntimeError(f"Error reading map file '{map_file}': {e}")
     
-    # Load processed DB
-    processed_db = database.load_processed_db()
-
     # Use default parameters if none provided
     if vehicle_params is None:
         vehicle_params = {
@@ -159,39 +254,44 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
             }
         }
     
-    # Create the root element for routes
-    routes_root = ET.Element("routes")
-    # Create vehicle type definitions using vehicle_params
-    for vtype, params in vehicle_params.items():
-        ET.SubElement(routes_root, "vType", id=vtype, **params)
+    # Flow attributes for the routes file, written once all intersections are processed
+    route_flows = []
     
     incomplete_data = []
     simulation_details = []
     
-    # Group CSV rows by centreline_id
-    data_rows_by_id = {}
+    # Group CSV rows by centreline_id, keeping only the intersections being simulated
     try:
-        with open(data_csv_file, newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            if "centreline_id" not in reader.fieldnames:
-                raise ValueError(f"CSV file '{data_csv_file}' is missing 'centreline_id' column.")
-            if "start_time" not in reader.fieldnames:
-                raise ValueError(f"CSV file '{data_csv_file}' is missing 'start_time' column.")
-            for row in reader:
-                key = str(row.get("centreline_id", "")).strip()
-                if not key:
-                    continue
-                data_rows_by_id.setdefault(key, []).append(row)
+        data_rows_by_id = rows_future.result()
     except Exception as e:
         raise RuntimeError(f"Error processing CSV file '{data_csv_file}': {e}")
     
+    # Intersections located by coordinates get their closest junctions in one batched lookup.
+    lookup_coords = {}
+    for inter in intersections:
+        if inter.get("intersection_id") or not inter.get("centreline_id"):
+            continue
+        unique_id = centreline_key(inter["centreline_id"])
+        rows = data_rows_by_id.get(unique_id)
+        if not rows:
+            continue
+        try:
+            lookup_coords[unique_id] = (float(rows[0]["longitude"]), float(rows[0]["latitude"]))
+        except Exception:
+            continue
+    try:
+        nearest = dict(zip(lookup_coords, edge_mapping.find_intersections(net, list(lookup_coords.values())))) if lookup_coords else {}
+    except Exception:
+        # Fall back to per-intersection lookups, which report their errors individually.
+        nearest = {}
+    
     # Process each intersection from JSON
     for inter in intersections:
         location_name = inter.get("location_name", f"Intersection {inter.get('centreline_id')}")
         if "centreline_id" not in inter or not inter["centreline_id"]:
             incomplete_data.append(f"Intersection '{location_name}' skipped: Missing centreline_id.")
             continue
-        unique_id = str(inter["centreline_id"]).strip()
+        unique_id = centreline_key(inter["centreline_id"])
         junction_id = None
         input_coords = None
         
@@ -204,7 +304,10 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
                 target_lat = float(first_row["latitude"])
                 input_coords = {"longitude": target_lon, "latitude": target_lat}
                 try:
-                    junction_id = edge_mapping.find_intersection(net, target_lon, target_lat)
+                    if unique_id in nearest:
+                        junction_id = edge_mapping.check_tolerance(*nearest[unique_id])
+                    else:
+                        junction_id = edge_mapping.find_intersection(net, target_lon, target_lat)
                 except Exception as ex:
                     incomplete_data.append(
                         f"Intersection '{location_name}' (ID: {unique_id}) skipped: "
@@ -227,43 +330,24 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
             )
             continue
         
-        # Compute availability intervals
-        intervals = []
-        for row in data_rows_by_id.get(unique_id, []):
-            try:
-                st = datetime.fromisoformat(row["start_time"])
-                et = datetime.fromisoformat(row["end_time"])
-                intervals.append((st, et))
-            except Exception:
-                continue
-        if not intervals:
+        # Compute availability intervals on int64 epoch seconds; datetimes are only formatted for the merged ones
+        timed_rows = [row for row in data_rows_by_id.get(unique_id, []) if row["_start_s"] is not None]
+        if not timed_rows:
             incomplete_data.append(
                 f"Intersection '{location_name}' (ID: {unique_id}) skipped: No valid time data in CSV."
             )
             continue
-        intervals.sort(key=lambda x: x[0])
-        merged_intervals = []
-        for st, et in intervals:
-            if not merged_intervals:
-                merged_intervals.append((st, et))
-            else:
-                last_st, last_et = merged_intervals[-1]
-                if st <= last_et:
-                    merged_intervals[-1] = (last_st, max(last_et, et))
-                else:
-                    merged_intervals.append((st, et))
+        merged_starts, merged_ends = merge_intervals(
+            np.fromiter((row["_start_s"] for row in timed_rows), dtype=np.int64, count=len(timed_rows)),
+            np.fromiter((row["_end_s"] for row in timed_rows), dtype=np.int64, count=len(timed_rows))
+        )
         availability_intervals = [
-            {
-                "start": st.strftime("%Y-%m-%d %H:%M:%S"),
-                "end": et.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            for st, et in merged_intervals
+            {"start": format_epoch(st), "end": format_epoch(et)}
+            for st, et in zip(merged_starts, merged_ends)
         ]
         
         # Check overlap with simulation window
-        if availability_intervals and not time_overlaps(
-            availability_intervals, simulation_start_dt, simulation_end_dt
-        ):
+        if not np.any((merged_starts < sim_end_s) & (merged_ends > sim_start_s)):
             incomplete_data.append(
                 f"Intersection '{location_name}' (ID: {unique_id}) skipped: "
                 f"Data not available for selected time window."
@@ -271,8 +355,8 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
             continue
         
         # Check or compute mapping
-        if junction_id in processed_db:
-            record = processed_db[junction_id]
+        record = database.load_record(junction_id)
+        if record is not None:
             mapping = record.get("edge_mapping")
         else:
             if "mapped_edges" in inter and inter["mapped_edges"]:
@@ -306,20 +390,23 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
                 "data_availability": availability_intervals,
                 "edge_mapping": mapping
             }
-            database.update_processed_db(junction_id, record)
+            database.upsert_record(junction_id, record)
         
         intersection_rows = data_rows_by_id.get(unique_id, [])
         try:
-            flows = generate_flows_for_intersection(
+            flows = list(generate_flows_for_intersection(
                 mapping, intersection_rows, junction_id,
                 simulation_start_dt, simulation_end_dt
-            )
+            ))
             if not flows:
                 incomplete_data.append(
                     f"Intersection '{location_name}' (ID: {junction_id}) has no flows "
                     f"for the selected time window."
                 )
                 continue
+            # Edge -> direction lookups, built once per intersection rather than scanned per flow
+            edge_to_in_dir = {e: d for d, es in mapping.get("incoming", {}).items() for e in es}
+            edge_to_out_dir = {e: d for d, es in mapping.get("outgoing", {}).items() for e in es}
             monitored_incoming = set()
             monitored_outgoing = set()
             incoming_directions = {}
@@ -329,13 +416,11 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
                 outgoing_edge = flow.get("to")
                 monitored_incoming.add(incoming_edge)
                 monitored_outgoing.add(outgoing_edge)
-                for direction, edges in mapping.get("incoming", {}).items():
-                    if incoming_edge in edges:
-                        incoming_directions[incoming_edge] = direction
-                for direction, edges in mapping.get("outgoing", {}).items():
-                    if outgoing_edge in edges:
-                        outgoing_directions[outgoing_edge] = direction
-                routes_root.append(flow)
+                if incoming_edge in edge_to_in_dir:
+                    incoming_directions[incoming_edge] = edge_to_in_dir[incoming_edge]
+                if outgoing_edge in edge_to_out_dir:
+                    outgoing_directions[outgoing_edge] = edge_to_out_dir[outgoing_edge]
+            route_flows.extend(flows)
             simulation_details.append({
                 "intersection_id": junction_id,
                 "centreline_id": unique_id,
@@ -354,10 +439,10 @@ def simulate_simulation(input_json_file, map_file, data_csv_file,
             )
             continue
 
-    if len(routes_root.findall("flow")) > 0:
+    database.flush_processed_db()
+    if route_flows:
         route_file = os.path.join(output_folder, "routes.rou.xml")
-        tree = ET.ElementTree(routes_root)
-        tree.write(route_file, encoding="utf-8", xml_declaration=True)
+        write_routes(route_file, vehicle_params, route_flows)
         details_file = os.path.join(output_folder, "simulation_details.json")
         with open(details_file, "w") as f:
             json.dump(simulation_details, f, indent=4)
@@ -1,88 +1,176 @@
 import os
-import csv
 import json
-from datetime import datetime
+
+# orjson parses noticeably faster than the standard library when it is available.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _JSON_READ_MODE = "rb"
+except ImportError:
+    _json_loads = json.loads
+    _JSON_READ_MODE = "r"
+
+# Parsed input JSON keyed by absolute path -> (mtime, intersections).
+_JSON_CACHE = {}
+
+def load_json(filename):
+    """Read and decode a JSON file with the fastest available decoder."""
+    with open(filename, _JSON_READ_MODE) as f:
+        return _json_loads(f.read())
 
 def load_input_json(filename):
     try:
-        with open(filename, "r") as f:
-            data = json.load(f)
+        path = os.path.abspath(filename)
+        mtime = os.path.getmtime(path)
+        cached = _JSON_CACHE.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        data = load_json(filename)
         if isinstance(data, dict):
             if "intersections" in data:
                 intersections = data["intersections"]
                 if not isinstance(intersections, list):
                     raise ValueError("'intersections' must be a list.")
-                return intersections
             else:
-                return [data]
+                intersections = [data]
         elif isinstance(data, list):
-            return data
+            intersections = data
         else:
             raise ValueError("Input JSON must be an object or list of intersections.")
+        _JSON_CACHE[path] = (mtime, intersections)
+        return intersections
     except Exception as e:
         raise RuntimeError(f"Error loading input JSON file '{filename}': {e}")
 
-def get_overall_time_range(json_file, data_csv_file):
-    intersections = load_input_json(json_file)
-    valid_ids = {str(inter["centreline_id"]).strip() for inter in intersections if "centreline_id" in inter and inter["centreline_id"]}
+# Rows read per pandas chunk when scanning the traffic CSV for time ranges.
+TIME_SCAN_CHUNK_ROWS = 200_000
+# Bytes per record batch when pyarrow's streaming CSV reader is used instead.
+ARROW_BLOCK_SIZE = 16 * 1024 * 1024
+# Format of the CKAN start_time/end_time values, and of the date-only values also accepted.
+CSV_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+CSV_DATE_FORMAT = "%Y-%m-%d"
+
+def _csv_columns(data_csv_file):
+    import pandas as pd
+    return set(pd.read_csv(data_csv_file, nrows=0).columns)
+
+def _csv_chunks(data_csv_file, columns):
+    """
+    Yield the given columns of the CSV as string DataFrames, a bounded chunk at a time.
+    pyarrow's multithreaded streaming reader is used when installed, pandas' C parser otherwise.
+    """
+    import pandas as pd
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        yield from pd.read_csv(data_csv_file, usecols=columns, dtype=str,
+                               keep_default_na=False, chunksize=TIME_SCAN_CHUNK_ROWS)
+        return
+    reader = pa_csv.open_csv(
+        data_csv_file,
+        read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={col: pa.string() for col in columns},
+            strings_can_be_null=False
+        )
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+def parse_csv_times(values):
+    """
+    Parse a Series of CSV start/end times with the explicit CSV_TIME_FORMAT; non-empty values that
+    do not match are retried as CSV_DATE_FORMAT dates. Anything else becomes NaT.
+    """
+    # Imported here so the GUI can import this module without loading pandas.
+    import pandas as pd
+    times = pd.to_datetime(values, format=CSV_TIME_FORMAT, errors="coerce")
+    retry = times.isna() & values.notna() & (values != "")
+    if retry.any():
+        times[retry] = pd.to_datetime(values[retry], format=CSV_DATE_FORMAT, errors="coerce")
+    return times
+
+def _scan_csv_times(data_csv_file, valid_ids, time_columns):
+    """
+    Yield (ids, times) per chunk of the traffic CSV, restricted to rows whose centreline_id is in
+    valid_ids. Only the needed columns are read; times maps each time column to parsed datetimes (NaT if invalid).
+    """
+    for chunk in _csv_chunks(data_csv_file, ["centreline_id", *time_columns]):
+        # Only the distinct raw ids are stripped and checked, not every row; then only matching rows are stripped.
+        ids = chunk["centreline_id"]
+        matching = [raw for raw in ids.unique() if raw.strip() in valid_ids]
+        if not matching:
+            continue
+        mask = ids.isin(matching)
+        times = {col: parse_csv_times(chunk.loc[mask, col]) for col in time_columns}
+        yield ids[mask].str.strip(), times
+
+def valid_centreline_ids(intersections):
+    return frozenset(str(inter["centreline_id"]).strip() for inter in intersections if "centreline_id" in inter and inter["centreline_id"])
+
+def get_overall_time_range(json_file, data_csv_file, intersections=None):
+    if intersections is None:
+        intersections = load_input_json(json_file)
+    valid_ids = valid_centreline_ids(intersections)
+    columns = _csv_columns(data_csv_file)
+    if "start_time" not in columns:
+        raise ValueError(f"CSV file '{data_csv_file}' is missing 'start_time' column.")
+    if "centreline_id" not in columns:
+        raise ValueError(f"CSV file '{data_csv_file}' is missing 'centreline_id' column.")
     overall_min = None
     overall_max = None
-    with open(data_csv_file, newline="") as f:
-        reader = csv.DictReader(f)
-        if "start_time" not in reader.fieldnames:
-            raise ValueError(f"CSV file '{data_csv_file}' is missing 'start_time' column.")
-        if "centreline_id" not in reader.fieldnames:
-            raise ValueError(f"CSV file '{data_csv_file}' is missing 'centreline_id' column.")
-        for row in reader:
-            key = str(row.get("centreline_id", "")).strip()
-            if key not in valid_ids:
-                continue
-            try:
-                dt = datetime.fromisoformat(row["start_time"])
-            except Exception:
-                continue
-            if overall_min is None or dt < overall_min:
-                overall_min = dt
-            if overall_max is None or dt > overall_max:
-                overall_max = dt
+    for _, times in _scan_csv_times(data_csv_file, valid_ids, ["start_time"]):
+        starts = times["start_time"].dropna()
+        if starts.empty:
+            continue
+        chunk_min, chunk_max = starts.min(), starts.max()
+        if overall_min is None or chunk_min < overall_min:
+            overall_min = chunk_min
+        if overall_max is None or chunk_max > overall_max:
+            overall_max = chunk_max
     if overall_min is None or overall_max is None:
         raise ValueError("Could not determine overall time range from traffic data.")
-    return overall_min, overall_max
+    return overall_min.to_pydatetime(), overall_max.to_pydatetime()
 
 def get_data_availability_by_intersection(json_file, data_csv_file):
-    import csv
-    from datetime import datetime
+    import pandas as pd
     intersections = load_input_json(json_file)
-    valid_ids = {str(inter["centreline_id"]).strip() for inter in intersections if "centreline_id" in inter and inter["centreline_id"]}
-    availability = {vid: [] for vid in valid_ids}
-    with open(data_csv_file, newline="") as f:
-        reader = csv.DictReader(f)
-        if "start_time" not in reader.fieldnames or "centreline_id" not in reader.fieldnames:
-            raise ValueError("CSV file is missing required columns.")
-        for row in reader:
-            key = str(row.get("centreline_id", "")).strip()
-            if key not in valid_ids:
-                continue
-            try:
-                st = datetime.fromisoformat(row["start_time"])
-                et = datetime.fromisoformat(row["end_time"])
-            except Exception:
-                continue
-            availability[key].append((st, et))
-    result = {}
-    for vid, intervals in availability.items():
-        if not intervals:
-            continue
-        intervals.sort(key=lambda x: x[0])
-        merged = []
-        for interval in intervals:
-            if not merged:
-                merged.append(interval)
-            else:
-                last = merged[-1]
-                if interval[0] <= last[1]:
-                    merged[-1] = (last[0], max(last[1], interval[1]))
-                else:
-                    merged.append(interval)
-        result[vid] = [{"start": i[0].strftime("%Y-%m-%d %H:%M:%S"), "end": i[1].strftime("%Y-%m-%d %H:%M:%S")} for i in merged]
-    return result
+    valid_ids = valid_centreline_ids(intersections)
+    columns = _csv_columns(data_csv_file)
+    if "start_time" not in columns or "centreline_id" not in columns:
+        raise ValueError("CSV file is missing required columns.")
+    # Without end times no interval can be built.
+    if "end_time" not in columns:
+        return {}
+    frames = [
+        pd.DataFrame({"cid": ids, "start": times["start_time"], "end": times["end_time"]}).dropna()
+        for ids, times in _scan_csv_times(data_csv_file, valid_ids, ["start_time", "end_time"])
+    ]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return {}
+    df = pd.concat(frames, ignore_index=True)
+    # The sweep only needs each intersection's rows in start order; TMC files usually are already,
+    # so the sort is skipped unless some start goes backwards within an intersection.
+    if (df.groupby("cid", sort=False)["start"].diff() < pd.Timedelta(0)).any():
+        df = df.sort_values("start", kind="stable", ignore_index=True)
+    # Sweep merge, vectorised: an interval opens a new block when it starts after every earlier
+    # interval of the same intersection has ended. Blocks are numbered per intersection, so
+    # rows of different intersections may stay interleaved.
+    cids = df["cid"]
+    reach = df.groupby(cids, sort=False)["end"].cummax()
+    prev_reach = reach.groupby(cids, sort=False).shift()
+    block = (prev_reach.isna() | (df["start"] > prev_reach)).groupby(cids, sort=False).cumsum().rename("block")
+    merged = (
+        df.groupby([cids, block], sort=False)
+        .agg(start=("start", "first"), end=("end", "max"))
+        .reset_index(level=0)
+    )
+    merged["start"] = merged["start"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    merged["end"] = merged["end"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        vid: group[["start", "end"]].to_dict("records")
+        for vid, group in merged.groupby("cid", sort=False)
+    }
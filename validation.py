@@ -1,19 +1,40 @@
+import os
 import sys
-import csv
-import json
 import re
+import json
+import hashlib
+import logging
+import functools
+from collections import Counter, defaultdict
 from datetime import datetime
+import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import traci
+import traci.constants as tc
+from simulator.utils import load_json, parse_csv_times
+from config import VALIDATION_CACHE_DIR
 
 SUMO_CONFIG_FILE = "sumo_sim_20250326_202651/simulation.sumocfg"
 SIM_DETAILS_FILE = "sumo_sim_20250326_202651/simulation_details.json"
 DATA_CSV_FILE    = "input/TMC_data.csv"
 
+# Rows per pandas chunk when aggregating the CSV counts.
+CSV_CHUNK_ROWS = 200_000
+
+# CSV columns that describe a count rather than hold one.
+COUNT_METADATA_COLUMNS = frozenset((
+    "_id", "count_id", "count_date", "location_name", "longitude",
+    "latitude", "centreline_type", "centreline_id", "px",
+    "start_time", "end_time"
+))
+
 # Regex to extract turning keys from vehicle IDs like:
 #    "cluster_..._w_appr_bus_t_0" -> "w_appr_bus_t"
-FLOW_KEY_PATTERN = re.compile(r'(?:n|s|e|w)_appr_[a-zA-Z]+(?:_[rlt])?')
+FLOW_KEY_PATTERN = re.compile(r'[nsew]_appr_[a-zA-Z]+(?:_[rlt])?')
 
+# SUMO reports the same vehicle on every step it stays on a monitored edge, so each id is matched once.
+@functools.lru_cache(maxsize=100000)
 def extract_turning_key(vehicle_id: str) -> str:
     """
     Attempt to find a turning key (e.g. 'n_appr_cars_r', 'w_appr_bus_t')
@@ -38,37 +59,50 @@ def run_simulation_collect_vehicle_keys(sumo_config_file, sim_details):
           ...
         }
     """
-    # Prepare data structure
-    intersection_vehicle_data = {
-        detail["intersection_id"]: {} for detail in sim_details
+    # Prepare data structure: one turning_key -> vehicle ids bucket per intersection
+    buckets = {
+        detail["intersection_id"]: defaultdict(set) for detail in sim_details
     }
     
+    # Each monitored edge is watched once, even when adjacent intersections share it,
+    # and its vehicles go straight into the bucket of every intersection that monitors it.
+    edge_to_buckets = defaultdict(list)
+    for detail in sim_details:
+        bucket = buckets[detail["intersection_id"]]
+        edges = detail.get("monitored_incoming_edges", []) + detail.get("monitored_outgoing_edges", [])
+        for edge in edges:
+            if not any(b is bucket for b in edge_to_buckets[edge]):
+                edge_to_buckets[edge].append(bucket)
+    
     traci.start(["sumo", "-c", sumo_config_file])
     
+    # Subscribed edges report their vehicle ids with every step in one batch instead of one request each.
+    for edge in edge_to_buckets:
+        try:
+            traci.edge.subscribe(edge, (tc.LAST_STEP_VEHICLE_ID_LIST,))
+        except Exception:
+            # If edge doesn't exist or some other error occurs
+            continue
+    
+    # Vehicles seen on each edge in the previous step; only vehicles that just entered are recorded.
+    prev_vids = defaultdict(frozenset)
+    
     while traci.simulation.getMinExpectedNumber() > 0:
         traci.simulationStep()
         
-        for detail in sim_details:
-            inter_id = detail["intersection_id"]
-            edges = detail.get("monitored_incoming_edges", []) + detail.get("monitored_outgoing_edges", [])
-            
-            for edge in edges:
-                try:
-                    vehicle_ids = traci.edge.getLastStepVehicleIDs(edge)
-                except Exception:
-                    # If edge doesn't exist or some other error occurs
+        for edge, results in traci.edge.getAllSubscriptionResults().items():
+            current = frozenset(results.get(tc.LAST_STEP_VEHICLE_ID_LIST, ()))
+            entered = current - prev_vids[edge]
+            prev_vids[edge] = current
+            for vid in entered:
+                tkey = extract_turning_key(vid)
+                if not tkey:
                     continue
-                
-                for vid in vehicle_ids:
-                    tkey = extract_turning_key(vid)
-                    if not tkey:
-                        continue
-                    if tkey not in intersection_vehicle_data[inter_id]:
-                        intersection_vehicle_data[inter_id][tkey] = set()
-                    intersection_vehicle_data[inter_id][tkey].add(vid)
+                for bucket in edge_to_buckets[edge]:
+                    bucket[tkey].add(vid)
     
     traci.close()
-    return intersection_vehicle_data
+    return {inter_id: dict(bucket) for inter_id, bucket in buckets.items()}
 
 def aggregate_csv_counts_by_intersection(data_csv_file, sim_details):
     """
@@ -92,67 +126,100 @@ def aggregate_csv_counts_by_intersection(data_csv_file, sim_details):
         except (KeyError, ValueError):
             sim_start, sim_end = None, None
         sim_windows[inter_id] = (sim_start, sim_end)
+    window_starts = {i: w[0] for i, w in sim_windows.items() if w[0] and w[1]}
+    window_ends = {i: w[1] for i, w in sim_windows.items() if w[0] and w[1]}
 
-    csv_counts = {}
+    csv_counts = defaultdict(Counter)
 
-    with open(data_csv_file, newline="") as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Match centreline_id in CSV to intersection_id from JSON
-            row_cid = row.get("centreline_id", "").strip()
-            if row_cid not in centreline_map:
-                continue
+    header = list(pd.read_csv(data_csv_file, nrows=0).columns)
+    if "centreline_id" not in header:
+        return csv_counts
+    # Turning-movement count columns, decided once: metadata and peds/bike columns are skipped.
+    count_cols = [
+        key for key in header
+        if key not in COUNT_METADATA_COLUMNS and "peds" not in key and "bike" not in key
+    ]
+    has_start = "start_time" in header
+    usecols = ["centreline_id"] + (["start_time"] if has_start else []) + count_cols
 
-            inter_id = centreline_map[row_cid]
-            sim_start, sim_end = sim_windows.get(inter_id, (None, None))
+    # A GROUP BY intersection SUM over the count columns, one pandas chunk at a time.
+    # Count columns are left to the C parser's numeric inference, so they arrive as numbers;
+    # only empty cells are treated as missing.
+    id_types = {col: str for col in usecols if col not in count_cols}
+    chunks = pd.read_csv(data_csv_file, usecols=usecols, dtype=id_types, keep_default_na=False,
+                         na_values=[""], chunksize=CSV_CHUNK_ROWS)
+    for chunk in chunks:
+        # Match centreline_id in CSV to intersection_id from JSON
+        inter_ids = chunk["centreline_id"].str.strip().map(centreline_map)
+        keep = inter_ids.notna()
 
-            # Optional check: only include rows that fall within a known time window
-            if sim_start and sim_end:
-                try:
-                    row_time = datetime.strptime(row["start_time"], "%Y-%m-%dT%H:%M:%S")
-                except (KeyError, ValueError):
-                    continue
-                if row_time < sim_start or row_time >= sim_end:
-                    continue
+        # Optional check: rows of an intersection with a known time window must start inside it
+        win_start = pd.to_datetime(inter_ids.map(window_starts))
+        win_end = pd.to_datetime(inter_ids.map(window_ends))
+        if has_start:
+            row_time = parse_csv_times(chunk["start_time"])
+            in_window = (row_time >= win_start) & (row_time < win_end)
+        else:
+            in_window = pd.Series(False, index=chunk.index)
+        keep &= win_start.isna() | in_window
+        if not keep.any():
+            continue
 
-            # Initialize dictionary if needed
-            if inter_id not in csv_counts:
-                csv_counts[inter_id] = {}
-
-            # Loop over each column in the row
-            for key, val in row.items():
-                # Skip metadata columns
-                if key in (
-                    "_id", "count_id", "count_date", "location_name", "longitude",
-                    "latitude", "centreline_type", "centreline_id", "px",
-                    "start_time", "end_time"
-                ):
-                    continue
+        # Missing and non-numeric cells count as 0; only a column that holds text needs to_numeric
+        counts = chunk.loc[keep, count_cols]
+        text_cols = [col for col in count_cols if not pd.api.types.is_numeric_dtype(counts[col])]
+        if text_cols:
+            counts = counts.copy()
+            counts[text_cols] = counts[text_cols].apply(pd.to_numeric, errors="coerce")
+        counts = counts.fillna(0).astype("int64")
+        for inter_id, sums in counts.groupby(inter_ids[keep], sort=False).sum().iterrows():
+            csv_counts[inter_id].update({key: int(val) for key, val in sums.items()})
 
-                # Skip all peds / bike columns
-                if "peds" in key or "bike" in key:
-                    continue
-
-                # Otherwise, treat this as a valid turning-movement count
-                try:
-                    count_val = int(val)
-                except ValueError:
-                    count_val = 0
+    return csv_counts
 
-                csv_counts[inter_id][key] = csv_counts[inter_id].get(key, 0) + count_val
+def csv_counts_cache_path(data_csv_file, sim_details, cache_dir=VALIDATION_CACHE_DIR):
+    """Return the cache file for the CSV counts of a CSV version and set of simulation details."""
+    stat = os.stat(data_csv_file)
+    key = json.dumps(
+        [os.path.abspath(data_csv_file), stat.st_mtime, stat.st_size, sim_details],
+        sort_keys=True, default=str
+    )
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"csv_counts-{digest}.json")
 
+def load_csv_counts(data_csv_file, sim_details, cache_dir=VALIDATION_CACHE_DIR):
+    """
+    aggregate_csv_counts_by_intersection, reusing the result of an earlier run when neither
+    the CSV nor the simulation details have changed.
+    """
+    path = csv_counts_cache_path(data_csv_file, sim_details, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable CSV counts cache entry {path}: {e}")
+    csv_counts = aggregate_csv_counts_by_intersection(data_csv_file, sim_details)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(csv_counts, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write CSV counts cache entry {path}: {e}")
     return csv_counts
 
 def validate_simulation():
     # Read the simulation details
-    with open(SIM_DETAILS_FILE, "r") as f:
-        sim_details = json.load(f)
+    sim_details = load_json(SIM_DETAILS_FILE)
     
     # Collect the actual vehicles (by turning key) from simulation
     sim_vehicle_data = run_simulation_collect_vehicle_keys(SUMO_CONFIG_FILE, sim_details)
     
     # Collect CSV data aggregated by intersection & turning key
-    csv_counts = aggregate_csv_counts_by_intersection(DATA_CSV_FILE, sim_details)
+    csv_counts = load_csv_counts(DATA_CSV_FILE, sim_details)
     
     # Compare
     report = []
@@ -187,32 +254,49 @@ def validate_simulation():
     
     return report
 
-def plot_comparison_chart(report):
+def _draw_comparison(ax, item):
+    inter_id = item["intersection_id"]
+    comp     = item["comparison"]
+    
+    keys = sorted(comp.keys())
+    sim_vals = [comp[k]["simulation"] for k in keys]
+    csv_vals = [comp[k]["csv"] for k in keys]
+    
+    x = range(len(keys))
+    width = 0.35
+    
+    ax.bar([xi - width/2 for xi in x], sim_vals, width, label="Simulation")
+    ax.bar([xi + width/2 for xi in x], csv_vals, width, label="CSV Data")
+    
+    ax.set_title(f"Intersection ID: {inter_id}")
+    ax.set_xlabel("Turning Movement Data")
+    ax.set_ylabel("Count")
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(keys, rotation=45, ha="right")
+    
+    ax.legend()
+
+def plot_comparison_chart(report, output_dir=None):
     """
     Plots a simple bar chart comparing simulation vs CSV for each intersection.
+    With output_dir, the charts are written there as validation_<intersection_id>.png
+    without a GUI backend, reusing one figure; otherwise each chart is shown interactively.
     """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        # A bare Figure renders with Agg on savefig, so no pyplot window or backend is started.
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        for item in report:
+            ax.clear()
+            _draw_comparison(ax, item)
+            fig.tight_layout()
+            fig.savefig(os.path.join(output_dir, f"validation_{item['intersection_id']}.png"), dpi=100)
+        return
+    
     for item in report:
-        inter_id = item["intersection_id"]
-        comp     = item["comparison"]
-        
-        keys = sorted(comp.keys())
-        sim_vals = [comp[k]["simulation"] for k in keys]
-        csv_vals = [comp[k]["csv"] for k in keys]
-        
-        x = range(len(keys))
-        width = 0.35
-        
         fig, ax = plt.subplots(figsize=(10, 6))
-        ax.bar([xi - width/2 for xi in x], sim_vals, width, label="Simulation")
-        ax.bar([xi + width/2 for xi in x], csv_vals, width, label="CSV Data")
-        
-        ax.set_title(f"Intersection ID: {inter_id}")
-        ax.set_xlabel("Turning Movement Data")
-        ax.set_ylabel("Count")
-        ax.set_xticks(list(x))
-        ax.set_xticklabels(keys, rotation=45, ha="right")
-        
-        ax.legend()
+        _draw_comparison(ax, item)
         plt.tight_layout()
         plt.show()
 
@@ -225,4 +309,5 @@ if __name__ == "__main__":
         for k, vals in row["comparison"].items():
             print(f"  {k} => simulation={vals['simulation']} csv={vals['csv']} diff={vals['difference']}")
     
-    plot_comparison_chart(report)
+    # Optional first argument: a folder to save the charts to instead of showing them.
+    plot_comparison_chart(report, output_dir=sys.argv[1] if len(sys.argv) > 1 else None)